@@ -0,0 +1,257 @@
+"""Loading every asset once when the game starts.
+
+An AssetRegistry decodes the sprite of every kind of entity, renders all of
+its rotations and packs them into a single atlas surface. Sprites, atlas
+frames and hitbox rects are then handed to ImageLoader as views into the
+atlas, so nothing is loaded or rendered while playing and hitbox images are
+never kept around just for their size. The collision mask of the whole atlas
+is handed over too, and the mask of a frame is only cut from it the first
+time a collision needs it.
+
+The packed atlas can be cached to a file: a header, a JSON index of where
+every frame is, then the pixels of the atlas and the bits of its collision
+mask exactly as they are laid out in memory. The next start reads them
+straight into a new surface and mask instead of decoding and rotating the
+PNGs, as long as the index still matches the asset files, the kinds asked
+for and the pixel format of the display. Being a copy of memory, the cache is
+only meant for the machine that wrote it.
+"""
+import json
+import os
+import struct
+import time
+from itertools import chain
+from pathlib import Path
+
+import pygame
+from pygame.image import load
+
+from image_loader import (
+    BASE_DIR, ROTATION_FRAMES, ImageLoader, RotationAtlas, SpriteData, mask_part, rot_center, scale_rect,
+    scale_sprite,
+)
+
+ATLAS_MAGIC = b"ASTATLAS"
+ATLAS_VERSION = 1
+# magic, version, length of the JSON index
+ATLAS_HEADER = struct.Struct("<8sII")
+# default atlas cache file
+ATLAS_CACHE = Path(BASE_DIR) / "atlas.cache"
+# width of the atlas, images are packed in rows this wide
+ATLAS_WIDTH = 2048
+
+
+def atlas_surface(size) -> pygame.Surface:
+    """Return a new surface for an atlas in the pixel format of the display."""
+    # made in the format of a converted pixel instead of converting the whole
+    # atlas, which would briefly need it twice
+    display_format = pygame.Surface((1, 1), pygame.SRCALPHA).convert_alpha()
+    return pygame.Surface(size, pygame.SRCALPHA, display_format)
+
+
+def surface_format(surface: pygame.Surface) -> list:
+    """Return the bytes per pixel, color masks and bytes per row of surface."""
+    return [surface.get_bytesize(), list(surface.get_masks()), surface.get_pitch()]
+
+
+def pack(sizes, width: int = ATLAS_WIDTH):
+    """Pack rects of the given (width, height) sizes into rows 'width' wide,
+    tallest first. Return the (x, y) of every rect, in the order of sizes,
+    and the height of the packed rows."""
+    positions = [None] * len(sizes)
+    x = y = row_height = 0
+    for i in sorted(range(len(sizes)), key=lambda i: -sizes[i][1]):
+        (w, h) = sizes[i]
+        if x + w > width:
+            x = 0
+            y += row_height
+            row_height = 0
+        positions[i] = (x, y)
+        x += w
+        row_height = max(row_height, h)
+    return positions, y + row_height
+
+
+class AssetRegistry:
+    """Every kind of entity preloaded into one atlas surface.
+
+    kinds is a list of (sprite path, hitbox path, scale), the same arguments
+    as ImageLoader.sprite_data. The hitbox can be None for sprites that only
+    need their rotations, like projectiles. load_ms and from_cache tell how
+    long loading took and whether the atlas cache was used.
+    """
+
+    __slots__ = 'kinds', 'steps', 'cache_path', 'atlas', 'atlas_mask', 'index', 'load_ms', 'from_cache'
+
+    def __init__(self, kinds, cache_path: str | Path | None = ATLAS_CACHE, steps: int = ROTATION_FRAMES) -> None:
+        """Init with the kinds to load and the atlas cache file, None to not use one.
+        Nothing is loaded until load is called, after the display mode is set."""
+        self.kinds = [(sprite, hitbox, float(scale)) for (sprite, hitbox, scale) in kinds]
+        self.steps = steps
+        self.cache_path = None if cache_path is None else Path(cache_path)
+        self.atlas = None
+        self.atlas_mask = None
+        self.index = None
+        self.load_ms = 0.0
+        self.from_cache = False
+
+    def sources(self) -> dict:
+        """Return the size and modification time of every asset file, to tell
+        whether a cached atlas is out of date."""
+        sources = {}
+        for (sprite, hitbox, _) in self.kinds:
+            for path in (sprite, hitbox):
+                if path is not None:
+                    stat = os.stat(Path(BASE_DIR) / path)
+                    sources[path] = [stat.st_size, stat.st_mtime_ns]
+        return sources
+
+    def load(self) -> None:
+        """Load the atlas from the cache, or build it and write the cache,
+        then give ImageLoader views of it."""
+        start = time.perf_counter()
+        sources = self.sources()
+        loaded = self.read_cache(sources) if self.cache_path is not None else None
+        self.from_cache = loaded is not None
+        if loaded is None:
+            loaded = self.build(sources)
+            if self.cache_path is not None:
+                self.write_cache(*loaded)
+        (self.atlas, self.atlas_mask, self.index) = loaded
+        self.install()
+        self.load_ms = (time.perf_counter() - start) * 1000
+
+    def build(self, sources: dict):
+        """Decode, scale and rotate the sprite of every kind and pack them all
+        into a new atlas. Return the atlas, its collision mask and its index."""
+        surfaces = []
+        hitboxes = []
+        for (sprite, hitbox, scale) in self.kinds:
+            surfaces.append(scale_sprite(load(Path(BASE_DIR) / sprite).convert_alpha(), scale))
+            if hitbox is None:
+                hitboxes.append(None)
+            else:
+                hitboxes.append(list(scale_rect(load(Path(BASE_DIR) / hitbox).get_rect(), scale).size))
+        # a sprite and all its rotations are the same size, so they are packed
+        # before rendering and every rotation can go into the atlas as soon as
+        # it is rendered, instead of all of them being held at once
+        per_kind = self.steps + 1
+        positions, height = pack([surface.get_size() for surface in surfaces for _ in range(per_kind)])
+        atlas = atlas_surface((ATLAS_WIDTH, height))
+        atlas.fill((0, 0, 0, 0))
+        for i, surface in enumerate(surfaces):
+            images = chain([surface], (rot_center(surface, j * 360 / self.steps) for j in range(self.steps)))
+            # adding to the cleared atlas copies the pixels as they are, where
+            # a plain blit would blend them
+            atlas.blits(
+                ((image, pos, None, pygame.BLEND_RGBA_ADD)
+                 for image, pos in zip(images, positions[i * per_kind:(i + 1) * per_kind])),
+                doreturn=False,
+            )
+
+        atlas_mask = pygame.mask.from_surface(atlas)
+        sprites = []
+        frames = []
+        drawn = []
+        for i, surface in enumerate(surfaces):
+            (x, y) = positions[i * per_kind]
+            size = surface.get_size()
+            sprites.append([x, y, *size])
+            kind_frames = positions[i * per_kind + 1:(i + 1) * per_kind]
+            frames.append([list(pos) for pos in kind_frames])
+            kind_drawn = []
+            for (x, y) in kind_frames:
+                rects = mask_part(atlas_mask, (x, y), size).get_bounding_rects()
+                rect = rects[0].unionall(rects[1:]) if rects else pygame.Rect(0, 0, 0, 0)
+                kind_drawn.append(list(rect))
+            drawn.append(kind_drawn)
+        index = {
+            "steps": self.steps,
+            "kinds": [list(kind) for kind in self.kinds],
+            "sources": sources,
+            "size": list(atlas.get_size()),
+            "format": surface_format(atlas),
+            "sprites": sprites,
+            "frames": frames,
+            "drawn": drawn,
+            "hitboxes": hitboxes,
+        }
+        return atlas, atlas_mask, index
+
+    def install(self) -> None:
+        """Fill the caches of ImageLoader with views of the atlas, so asking
+        it for any of the kinds finds them already loaded. Masks of the views
+        are cut from the atlas mask once they are asked for."""
+        atlas = self.atlas
+        atlas_mask = self.atlas_mask
+        index = self.index
+        # views of an atlas loaded before, by an earlier game, are replaced
+        ImageLoader.clear()
+        ImageLoader.atlas_masks[atlas] = atlas_mask
+        for i, (sprite_path, hitbox_path, scale) in enumerate(self.kinds):
+            (x, y, width, height) = index["sprites"][i]
+            size = (width, height)
+            sprite = atlas.subsurface((x, y), size)
+            frames = []
+            for pos, drawn in zip(index["frames"][i], index["drawn"][i]):
+                frame = atlas.subsurface(pos, size)
+                ImageLoader.drawn_rects[frame] = pygame.Rect(drawn)
+                frames.append(frame)
+            ImageLoader.atlases[(sprite, self.steps)] = RotationAtlas(sprite, self.steps, frames)
+            if scale == 1.0:
+                ImageLoader.sprites[(sprite_path, True)] = sprite
+            if hitbox_path is not None:
+                hitbox = pygame.Rect((0, 0), index["hitboxes"][i])
+                ImageLoader.sprite_datas[(sprite_path, hitbox_path, scale)] = SpriteData(sprite, hitbox)
+
+    def read_cache(self, sources: dict):
+        """Return the atlas, mask and index of the cache file, or None when
+        there is none or it doesn't match the assets and kinds anymore."""
+        try:
+            with open(self.cache_path, "rb") as file:
+                magic, version, index_len = ATLAS_HEADER.unpack(file.read(ATLAS_HEADER.size))
+                if magic != ATLAS_MAGIC or version != ATLAS_VERSION:
+                    return None
+                index = json.loads(file.read(index_len))
+                if (index["steps"] != self.steps or index["sources"] != sources
+                        or index["kinds"] != [list(kind) for kind in self.kinds]):
+                    return None
+                size = tuple(index["size"])
+                atlas = atlas_surface(size)
+                if index["format"] != surface_format(atlas):
+                    return None
+                atlas_mask = pygame.mask.Mask(size)
+                for buffer in (atlas.get_view("0"), atlas_mask):
+                    view = memoryview(buffer).cast("B")
+                    if file.readinto(view) != len(view):
+                        return None
+        except (OSError, ValueError, KeyError, struct.error):
+            return None
+        return atlas, atlas_mask, index
+
+    def write_cache(self, atlas: pygame.Surface, atlas_mask: pygame.mask.Mask, index: dict) -> None:
+        """Write the atlas, its mask and its index to the cache file. Failing
+        to write it only means the next start builds the atlas again."""
+        data = json.dumps(index, separators=(",", ":")).encode()
+        temp_path = self.cache_path.with_name(self.cache_path.name + ".tmp")
+        try:
+            with open(temp_path, "wb") as file:
+                file.write(ATLAS_HEADER.pack(ATLAS_MAGIC, ATLAS_VERSION, len(data)))
+                file.write(data)
+                file.write(atlas.get_view("0"))
+                file.write(memoryview(atlas_mask))
+            os.replace(temp_path, self.cache_path)
+        except OSError as error:
+            print("could not write the atlas cache", self.cache_path, error)
+
+    def info(self) -> dict:
+        """Return how long loading took, whether the cache was used and the
+        size of the atlas."""
+        (width, height) = self.atlas.get_size()
+        return {
+            "load_ms": self.load_ms,
+            "from_cache": self.from_cache,
+            "kinds": len(self.kinds),
+            "atlas_size": [width, height],
+            "atlas_bytes": width * height * self.atlas.get_bytesize(),
+        }
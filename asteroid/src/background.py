@@ -1,12 +1,15 @@
-from random import randint, randrange
+import random
 from typing import List
 import pygame
 
+# how far each parallax layer of stars moves compared to the ship, farthest first
+PARALLAX_SPEEDS = (0.1, 0.3, 0.6)
+
 
 class Star:
     """A single star."""
 
-    __slots__ = 'screen', 'color', 'x', 'y', 'center', 'radius'
+    __slots__ = 'screen', 'color', 'x', 'y', 'center', 'radius', 'layer'
 
     def __init__(
             self,
@@ -15,40 +18,96 @@ class Star:
             x: int,
             y: int,
             radius:int,
+            layer: int = 0,
     ) -> None:
-        """Init with game screen, color, x ,y which represent center of the circle and radius."""
+        """Init with game screen, color, x ,y which represent center of the circle, radius and background layer."""
         self.screen = screen
         self.color = color
         self.x = x
         self.y = y
         self.center = (x, y)
         self.radius = radius
+        self.layer = layer
 
-    def draw(self) -> None:
-        """Draw self onto the screen."""
-        pygame.draw.circle(self.screen, self.color, self.center, self.radius)
+    def draw(self, surface: pygame.Surface | None = None) -> None:
+        """Draw self onto surface, or the screen by default."""
+        pygame.draw.circle(surface or self.screen, self.color, self.center, self.radius)
 
 
 class Background:
-    """Logic for any code relating to the background of the game."""
+    """Logic for any code relating to the background of the game.
+
+    The stars never change, so they are drawn once onto cached layer surfaces
+    and every frame just copies the layers to the screen. With parallax the
+    stars are spread over layers that scroll at different speeds, otherwise
+    there is a single layer that never moves.
+    """
 
-    __slots__ = 'screen', 'stars'
+    __slots__ = 'screen', 'rng', 'stars', 'speeds', 'layers', 'offsets'
 
-    def __init__(self, screen) -> None:
-        """Init with screen and empty list container for stars."""
+    def __init__(self, screen, parallax: bool = False, rng: random.Random | None = None) -> None:
+        """Init with screen, the random number generator placing the stars and empty list container for stars."""
         self.screen = screen
+        self.rng = rng or random.Random()
         self.stars = list()
+        # how far each layer moves compared to the ship
+        self.speeds = PARALLAX_SPEEDS if parallax else (0,)
+        # cached surface of every layer, farthest first, made by render
+        self.layers = []
+        # how far each layer has scrolled, between (0, 0) and the screen size
+        self.offsets = [pygame.Vector2() for _ in self.speeds]
 
     def create_stars(self, number: int) -> List[Star]:
         """Create a number of Star objects and append to self.stars."""
+        rng = self.rng
         for i in range(number):
-            x = randint(1, self.screen.get_width())
-            y = randint(1, self.screen.get_height())
-            radius = randrange(1, 3)
-            self.stars.append(Star(self.screen, 'white', x, y, radius))
+            x = rng.randint(1, self.screen.get_width())
+            y = rng.randint(1, self.screen.get_height())
+            radius = rng.randrange(1, 3)
+            layer = rng.randrange(len(self.speeds))
+            self.stars.append(Star(self.screen, 'white', x, y, radius, layer))
+        self.render()
         return self.stars
 
-    def draw_stars(self) -> None:
-        """Draw each Star stored in self.stars."""
+    def render(self) -> None:
+        """Draw the stars onto the cached layer surfaces."""
+        size = self.screen.get_size()
+        self.layers = []
+        for i in range(len(self.speeds)):
+            layer = pygame.Surface(size).convert()
+            if i > 0:
+                # the layers in front only draw their stars
+                layer.set_colorkey((0, 0, 0))
+            self.layers.append(layer)
         for star in self.stars:
-            star.draw()
\ No newline at end of file
+            star.draw(self.layers[star.layer])
+
+    def scroll(self, velocity) -> None:
+        """Move the layers the opposite way of a ship moving with velocity."""
+        (width, height) = self.screen.get_size()
+        for offset, speed in zip(self.offsets, self.speeds):
+            if speed:
+                offset.x = (offset.x - velocity[0] * speed) % width
+                offset.y = (offset.y - velocity[1] * speed) % height
+
+    def draw_stars(self) -> None:
+        """Draw the whole background, which covers everything drawn before."""
+        if not self.layers:
+            self.render()
+        (width, height) = self.screen.get_size()
+        for layer, offset in zip(self.layers, self.offsets):
+            (x, y) = (int(offset.x), int(offset.y))
+            self.screen.blit(layer, (x, y))
+            # the parts that scrolled off one side come back on the other
+            if x:
+                self.screen.blit(layer, (x - width, y))
+            if y:
+                self.screen.blit(layer, (x, y - height))
+            if x and y:
+                self.screen.blit(layer, (x - width, y - height))
+
+    def restore(self, rects) -> None:
+        """Draw the background over rects only. Needs a background without
+        parallax, which never moves."""
+        layer = self.layers[0]
+        self.screen.blits([(layer, rect, rect) for rect in rects], doreturn=False)
@@ -0,0 +1,331 @@
+"""Time parts of the game without a window.
+
+Examples:
+    python src/benchmark.py collisions --projectiles 1000 --asteroids 500 --frames 300
+    python src/benchmark.py projectiles --projectiles 10000 --frames 600
+    python src/benchmark.py stress --asteroids 500 1000 2000 4000 --frames 300
+    python src/benchmark.py startup
+
+collisions fills the screen with moving projectiles and asteroids and times
+finding every projectile-asteroid and ship-asteroid hit each frame, with the
+spatial hash or, with --naive, by checking every pair. Nothing is destroyed
+so the counts stay the same.
+
+projectiles keeps the projectile pool full, firing new projectiles as old
+ones leave the screen, and times moving and drawing them each frame.
+
+stress spawns each number of asteroids with Game.stress in turn and
+times a tick of game logic and drawing a frame, to see how frame time grows
+with the number of asteroids. The ship is kept off the screen so the
+asteroids aren't destroyed.
+
+startup loads every sprite, rotation, mask and hitbox the game needs in
+three fresh processes: lazily through ImageLoader the way the game used to,
+by building the asset atlas, and from the atlas cache the build wrote. It
+times each and reports how much the process grew while loading.
+
+All of them print a single JSON object.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# no display is needed, but loading sprites needs a display mode
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import pygame
+
+from assets import AssetRegistry
+from collisions import overlap, sprite_rect
+from image_loader import ImageLoader
+from main import SCREEN_WIDTH, SCREEN_HEIGHT, SPRITE_KINDS, Entity, Game
+# main.py puts the shared directory on the path
+from frame_profiler import percentile
+from projectiles import ProjectilePool
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+def summary_ms(times):
+    """return the mean and percentiles of a list of nanosecond times in ms"""
+    if not times:
+        return None
+    times = sorted(times)
+    return {
+        "mean": sum(times) / len(times) / 1e6,
+        "p50": percentile(times, 0.50) / 1e6,
+        "p90": percentile(times, 0.90) / 1e6,
+        "p99": percentile(times, 0.99) / 1e6,
+        "max": times[-1] / 1e6,
+    }
+
+
+def fire(pool, rng):
+    """fire a projectile from a random place on the screen in a random direction"""
+    rotation = rng.randint(0, 359)
+    direction = math.radians(rotation + 90)
+    pool.spawn(
+        (rng.uniform(0, SCREEN_WIDTH), rng.uniform(0, SCREEN_HEIGHT)),
+        (3 * math.cos(direction), -3 * math.sin(direction)),
+        rotation,
+    )
+
+
+def naive_hits(game):
+    """return the number of projectile-asteroid and ship-asteroid hits found
+    by checking every pair"""
+    hits = 0
+    rects = [a.hitbox_rect() for a in game.asteroids]
+    pool = game.projectiles
+    for slot in pool.live().tolist():
+        sprite = pool.sprite(slot)
+        pos = pool.pos[slot].tolist()
+        rect = sprite_rect(sprite, pos)
+        for a, asteroid_rect in zip(game.asteroids, rects):
+            if rect.colliderect(asteroid_rect) and overlap(sprite, pos, a.displayed_sprite, a.pos):
+                hits += 1
+                break
+    ship = game.ship
+    ship_rect = ship.hitbox_rect()
+    for a, asteroid_rect in zip(game.asteroids, rects):
+        if ship_rect.colliderect(asteroid_rect) and overlap(ship.displayed_sprite, ship.pos, a.displayed_sprite, a.pos):
+            hits += 1
+            break
+    return hits
+
+
+def spatial_hash_hits(game):
+    """return the number of projectile-asteroid and ship-asteroid hits found
+    with the spatial hash"""
+    collisions = game.collisions
+    collisions.update(game.asteroids)
+    hits = len(collisions.projectile_hits(game.projectiles, game.asteroids))
+    ship = game.ship
+    if collisions.hit(ship.displayed_sprite, ship.pos, game.asteroids, ship.hitbox_rect()) is not None:
+        hits += 1
+    return hits
+
+
+def run_collisions(projectiles, asteroids, frames, naive=False, seed=0):
+    """Move the entities for a number of frames, time the collision checks
+    and return the results as a dict."""
+    rng = random.Random(seed)
+    game = Game()
+    for _ in range(asteroids):
+        asteroid = Entity(game.screen, "assets/asteroid.png", "assets/asteroidhitbox.png")
+        asteroid.pos = pygame.Vector2(rng.uniform(0, SCREEN_WIDTH), rng.uniform(0, SCREEN_HEIGHT))
+        asteroid.rotate(rng.randint(0, 359))
+        asteroid.add_forward_velocity(0.8)
+        game.asteroids.append(asteroid)
+    game.projectiles = ProjectilePool(projectiles)
+    for _ in range(projectiles):
+        fire(game.projectiles, rng)
+
+    find_hits = naive_hits if naive else spatial_hash_hits
+    times = []
+    hits = 0
+    clock = time.perf_counter_ns
+    pool = game.projectiles
+    for _ in range(frames):
+        pool.pos += pool.velocity
+        # wrap around instead of cleaning up, so the count stays the same
+        pool.pos %= (SCREEN_WIDTH, SCREEN_HEIGHT)
+        game.move_asteroids()
+        start = clock()
+        hits += find_hits(game)
+        times.append(clock() - start)
+    pygame.quit()
+
+    return {
+        "benchmark": "collisions",
+        "method": "naive" if naive else "spatial_hash",
+        "projectiles": projectiles,
+        "asteroids": asteroids,
+        "frames": frames,
+        "hits": hits,
+        "collision_ms": summary_ms(times),
+    }
+
+
+def run_projectiles(projectiles, frames, seed=0):
+    """Keep a pool of projectiles full for a number of frames, time moving and
+    drawing them and return the results as a dict."""
+    rng = random.Random(seed)
+    game = Game()
+    pool = game.projectiles = ProjectilePool(projectiles)
+    screen = game.screen
+
+    def frame(i):
+        while pool.free:
+            fire(pool, rng)
+        start = clock()
+        pool.update(SCREEN_WIDTH, SCREEN_HEIGHT)
+        update_times[i] = clock() - start
+        start = clock()
+        screen.fill((0, 0, 0))
+        pool.draw(screen)
+        draw_times[i] = clock() - start
+
+    # filled in place so the second run below doesn't count them as growth
+    update_times = [0] * frames
+    draw_times = [0] * frames
+    clock = time.perf_counter_ns
+    for i in range(frames):
+        frame(i)
+    timed = (summary_ms(update_times), summary_ms(draw_times))
+    # tracing slows everything down, so memory is measured over a second run
+    tracemalloc.start()
+    start_memory = tracemalloc.get_traced_memory()[0]
+    for i in range(frames):
+        frame(i)
+    end_memory, peak_memory = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    pygame.quit()
+
+    return {
+        "benchmark": "projectiles",
+        "projectiles": projectiles,
+        "frames": frames,
+        "update_ms": timed[0],
+        "draw_ms": timed[1],
+        "memory_growth_bytes": end_memory - start_memory,
+        "peak_memory_growth_bytes": peak_memory - start_memory,
+    }
+
+
+def run_stress(counts, frames, seed=0):
+    """Time game logic and drawing with every number of asteroids in counts
+    and return the results as a dict."""
+    results = []
+    clock = time.perf_counter_ns
+    for count in counts:
+        game = Game(seed=seed)
+        game.stress(count)
+        logic_times = [0] * frames
+        draw_times = [0] * frames
+        for i in range(frames):
+            # out of the way of the asteroids
+            game.ship.pos.update(-SCREEN_WIDTH, -SCREEN_HEIGHT)
+            start = clock()
+            game.process_game_logic()
+            logic_times[i] = clock() - start
+            start = clock()
+            game.draw_game_elements()
+            draw_times[i] = clock() - start
+        results.append({
+            "asteroids": count,
+            "logic_ms": summary_ms(logic_times),
+            "draw_ms": summary_ms(draw_times),
+        })
+        pygame.quit()
+    return {"benchmark": "stress", "frames": frames, "results": results}
+
+
+def resident_kib():
+    """return the resident size of this process in KiB, None when not on Linux"""
+    try:
+        with open("/proc/self/statm") as file:
+            return int(file.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") // 1024
+    except OSError:
+        return None
+
+
+def load_startup(mode, cache_path):
+    """Load every kind of sprite once in this process, lazily, by building
+    the atlas or from the atlas cache, and return the time it took and how
+    much the resident size of the process grew, in KiB. The size after
+    loading is only known on Linux, the largest size everywhere but Windows."""
+    pygame.init()
+    pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    if mode == "build" and os.path.exists(cache_path):
+        os.remove(cache_path)
+    rss_before = resident_kib()
+    max_rss_before = None if resource is None else resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    start = time.perf_counter_ns()
+    if mode == "lazy":
+        for (sprite, hitbox, scale) in SPRITE_KINDS:
+            if hitbox is None:
+                surface = ImageLoader.load_sprite(sprite)
+            else:
+                surface = ImageLoader.sprite_data(sprite, hitbox, scale).sprite
+            for frame in ImageLoader.rotation_atlas(surface).frames:
+                ImageLoader.drawn_rect(frame)
+        from_cache = False
+    else:
+        registry = AssetRegistry(SPRITE_KINDS, cache_path)
+        registry.load()
+        from_cache = registry.from_cache
+    load_ms = (time.perf_counter_ns() - start) / 1e6
+    rss_after = resident_kib()
+    max_rss_growth = None if resource is None else resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - max_rss_before
+    pygame.quit()
+    return {
+        "mode": mode,
+        "load_ms": load_ms,
+        "from_cache": from_cache,
+        "rss_growth_kib": None if rss_before is None else rss_after - rss_before,
+        "max_rss_growth_kib": max_rss_growth,
+    }
+
+
+def run_startup(cache_path=None):
+    """Load the sprites lazily, by building the atlas and from its cache,
+    each in a new process so they don't share caches, and return the results
+    as a dict."""
+    with tempfile.TemporaryDirectory() as directory:
+        if cache_path is None:
+            cache_path = os.path.join(directory, "atlas.cache")
+        results = []
+        for mode in ("lazy", "build", "cache"):
+            output = subprocess.run(
+                [sys.executable, __file__, "startup", "--mode", mode, "--atlas-cache", cache_path],
+                check=True, capture_output=True, text=True,
+            ).stdout
+            results.append(json.loads(output))
+    return {"benchmark": "startup", "kinds": len(SPRITE_KINDS), "results": results}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless asteroid benchmarks")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+    collisions = subparsers.add_parser("collisions", help="time collision detection")
+    collisions.add_argument("--projectiles", type=int, default=1000)
+    collisions.add_argument("--asteroids", type=int, default=500)
+    collisions.add_argument("--frames", type=int, default=300)
+    collisions.add_argument("--naive", action="store_true", help="check every pair instead of using the spatial hash")
+    collisions.add_argument("--seed", type=int, default=0)
+    projectiles = subparsers.add_parser("projectiles", help="time moving and drawing a full projectile pool")
+    projectiles.add_argument("--projectiles", type=int, default=10000)
+    projectiles.add_argument("--frames", type=int, default=600)
+    projectiles.add_argument("--seed", type=int, default=0)
+    stress = subparsers.add_parser("stress", help="time game logic and drawing with thousands of asteroids")
+    stress.add_argument("--asteroids", type=int, nargs="+", default=[500, 1000, 2000, 4000])
+    stress.add_argument("--frames", type=int, default=300)
+    stress.add_argument("--seed", type=int, default=0)
+    startup = subparsers.add_parser("startup", help="time loading the sprites with and without the atlas cache")
+    startup.add_argument("--mode", choices=("lazy", "build", "cache"), help="load one way in this process only")
+    startup.add_argument("--atlas-cache", help="atlas cache file, a temporary one by default")
+    args = parser.parse_args()
+    if args.benchmark == "startup":
+        if args.mode is None:
+            results = run_startup(args.atlas_cache)
+        else:
+            results = load_startup(args.mode, args.atlas_cache)
+    elif args.benchmark == "collisions":
+        results = run_collisions(args.projectiles, args.asteroids, args.frames, args.naive, args.seed)
+    elif args.benchmark == "projectiles":
+        results = run_projectiles(args.projectiles, args.frames, args.seed)
+    else:
+        results = run_stress(args.asteroids, args.frames, args.seed)
+    print(json.dumps(results))
@@ -0,0 +1,125 @@
+"""Finding which entities touch each other.
+
+Collisions are found in two phases. The broadphase puts the bounding rect of
+every asteroid into a SpatialHash, a uniform grid of CELL_SIZE wide cells, so
+each projectile or ship only has to be checked against the few asteroids in
+the cells it covers instead of against all of them. The narrowphase then checks
+those pairs, first with their rects and then with the masks of their sprites,
+so only pixels that are actually drawn count as a hit.
+"""
+from collections import defaultdict
+
+import pygame
+
+from image_loader import ImageLoader
+
+# width and height of a spatial hash cell, a bit bigger than an asteroid
+CELL_SIZE = 64
+
+
+class SpatialHash:
+    """Uniform grid that finds the items whose rects are near a rect."""
+
+    __slots__ = 'cell_size', 'cells'
+
+    def __init__(self, cell_size: int = CELL_SIZE) -> None:
+        """Init with the size of a cell and no items."""
+        self.cell_size = cell_size
+        # items of every (column, row) cell, an item is in every cell its rect touches
+        self.cells = defaultdict(list)
+
+    def clear(self) -> None:
+        """Remove every item."""
+        self.cells.clear()
+
+    def cell_range(self, rect: pygame.Rect):
+        """Return the columns and rows of the cells rect touches."""
+        size = self.cell_size
+        columns = range(rect.left // size, (rect.right - 1) // size + 1)
+        rows = range(rect.top // size, (rect.bottom - 1) // size + 1)
+        return columns, rows
+
+    def insert(self, item, rect: pygame.Rect) -> None:
+        """Add item to every cell rect touches."""
+        cells = self.cells
+        columns, rows = self.cell_range(rect)
+        for column in columns:
+            for row in rows:
+                cells[(column, row)].append(item)
+
+    def query(self, rect: pygame.Rect) -> set:
+        """Return the items in the cells rect touches, which includes every
+        item whose rect overlaps it."""
+        found = set()
+        cells = self.cells
+        columns, rows = self.cell_range(rect)
+        for column in columns:
+            for row in rows:
+                items = cells.get((column, row))
+                if items:
+                    found.update(items)
+        return found
+
+
+def sprite_rect(sprite: pygame.Surface, pos) -> pygame.Rect:
+    """Return the rect around the drawn pixels of sprite drawn at pos."""
+    return ImageLoader.drawn_rect(sprite).move(int(pos[0]), int(pos[1]))
+
+
+def overlap(sprite_a: pygame.Surface, pos_a, sprite_b: pygame.Surface, pos_b) -> bool:
+    """Return whether any drawn pixels of two sprites drawn at pos_a and pos_b overlap."""
+    offset = (int(pos_b[0]) - int(pos_a[0]), int(pos_b[1]) - int(pos_a[1]))
+    return ImageLoader.mask(sprite_a).overlap(ImageLoader.mask(sprite_b), offset) is not None
+
+
+class Collisions:
+    """Finds what the ship and the projectiles hit among the asteroids."""
+
+    __slots__ = 'grid', 'rects'
+
+    def __init__(self, cell_size: int = CELL_SIZE) -> None:
+        """Init with an empty spatial hash."""
+        self.grid = SpatialHash(cell_size)
+        # rect of every asteroid in the grid, by its index
+        self.rects = []
+
+    def update(self, asteroids) -> None:
+        """Rebuild the spatial hash from where the asteroids are now."""
+        self.grid.clear()
+        self.rects = []
+        for i, asteroid in enumerate(asteroids):
+            rect = asteroid.hitbox_rect()
+            self.rects.append(rect)
+            self.grid.insert(i, rect)
+
+    def hit(self, sprite: pygame.Surface, pos, asteroids, rect: pygame.Rect | None = None) -> int | None:
+        """Return the index of an asteroid that sprite drawn at pos touches,
+        or None. rect narrows the broadphase down, it defaults to the rect of
+        the sprite."""
+        if rect is None:
+            rect = sprite_rect(sprite, pos)
+        rects = self.rects
+        for i in self.grid.query(rect):
+            if not rect.colliderect(rects[i]):
+                continue
+            asteroid = asteroids[i]
+            if overlap(sprite, pos, asteroid.displayed_sprite, asteroid.pos):
+                return i
+        return None
+
+    def projectile_hits(self, projectiles, asteroids) -> list:
+        """Return (slot, asteroid index) for every projectile of a
+        ProjectilePool that touches an asteroid, each projectile hitting at
+        most one asteroid."""
+        hits = []
+        if not self.rects:
+            return hits
+        slots = projectiles.live()
+        frames = projectiles.atlas.frames
+        for slot, frame, pos in zip(
+            slots.tolist(), projectiles.frame[slots].tolist(), projectiles.pos[slots].tolist()
+        ):
+            i = self.hit(frames[frame], pos, asteroids)
+            if i is not None:
+                hits.append((slot, i))
+        return hits
@@ -1,3 +1,4 @@
+import math
 import os
 from pathlib import Path
 
@@ -6,15 +7,205 @@ from pygame.image import load
 
 BASE_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
 
+# frames of a full turn in a RotationAtlas
+ROTATION_FRAMES = 360
+
+
+def rot_center(image, angle):
+    """
+    Rotate an image while keeping its center and size.
+    https://www.pygame.org/wiki/RotateCenter?parent=CookBook
+    """
+    orig_rect = image.get_rect()
+    rot_image = pygame.transform.rotate(image, angle)
+    rot_rect = orig_rect.copy()
+    rot_rect.center = rot_image.get_rect().center
+    rot_image = rot_image.subsurface(rot_rect).copy()
+    return rot_image
+
+
+class RotationAtlas:
+    """A sprite rotated to every one of 'steps' evenly spaced angles.
+
+    The frames are all rendered when the atlas is made, after that rotating
+    only means picking a frame.
+    """
+
+    __slots__ = 'steps', 'frames'
+
+    def __init__(self, sprite: pygame.Surface, steps: int = ROTATION_FRAMES, frames: list | None = None) -> None:
+        """Render the frames of sprite, frame i is rotated i * 360 / steps degrees.
+        Frames that were already rendered, like the views of an AssetRegistry, can be passed instead."""
+        self.steps = steps
+        if frames is None:
+            frames = [rot_center(sprite, i * 360 / steps) for i in range(steps)]
+        self.frames = frames
+
+    def index(self, angle: float | int) -> int:
+        """Return the index of the frame closest to 'angle' degrees."""
+        return round(angle * self.steps / 360) % self.steps
+
+    def frame(self, angle: float | int) -> pygame.Surface:
+        """Return the frame closest to 'angle' degrees."""
+        return self.frames[self.index(angle)]
+
+
+def mask_part(mask: pygame.mask.Mask, pos, size) -> pygame.mask.Mask:
+    """Return the part of mask at pos the given size as a new mask."""
+    part = pygame.mask.Mask(size)
+    part.draw(mask, (-pos[0], -pos[1]))
+    return part
+
+
+def scale_sprite(sprite: pygame.Surface, scale: float) -> pygame.Surface:
+    """Return sprite smoothly scaled by 'scale', at least a pixel wide and high."""
+    if scale == 1.0:
+        return sprite
+    (width, height) = sprite.get_size()
+    return pygame.transform.smoothscale(sprite, (max(1, round(width * scale)), max(1, round(height * scale))))
+
+
+def scale_rect(rect: pygame.Rect, scale: float) -> pygame.Rect:
+    """Return a rect at 0, 0 the size of rect scaled by 'scale', at least a pixel wide and high."""
+    return pygame.Rect(0, 0, max(1, round(rect.width * scale)), max(1, round(rect.height * scale)))
+
+
+class SpriteData:
+    """The sprite, rotation atlas and hitbox of a kind of entity.
+
+    Every entity of the same kind shares one SpriteData (a flyweight), so
+    having thousands of asteroids doesn't mean thousands of copies of them.
+    The rects are shared too, so they must be copied to change them.
+    """
+
+    __slots__ = 'sprite', 'atlas', 'hitbox', 'hitboxes'
+
+    def __init__(self, sprite: pygame.Surface, hitbox: pygame.Rect) -> None:
+        """Init with a sprite and the rect of its hitbox."""
+        self.sprite = sprite
+        self.atlas = ImageLoader.rotation_atlas(sprite)
+        self.hitbox = hitbox
+        # for every atlas frame, the hitbox centered on the sprite and grown
+        # to fit around it when rotated, relative to the top left of the sprite
+        center = sprite.get_rect().center
+        self.hitboxes = []
+        for i in range(self.atlas.steps):
+            angle = math.radians(i * 360 / self.atlas.steps)
+            cos = abs(math.cos(angle))
+            sin = abs(math.sin(angle))
+            (width, height) = hitbox.size
+            rect = pygame.Rect(0, 0, math.ceil(width * cos + height * sin), math.ceil(width * sin + height * cos))
+            rect.center = center
+            self.hitboxes.append(rect)
+
 
 class ImageLoader:
-    """Class that handles loading image assets for the game."""
+    """Class that handles loading image assets for the game.
+
+    Every file is only read and converted once, after that the same surface is
+    returned, so the surfaces must not be drawn on. Rotated sprites come from
+    the RotationAtlas of their sprite. The hits and misses of the sprite cache
+    are counted, see cache_info. An AssetRegistry (see assets.py) fills the caches
+    when the game starts, so nothing has to be loaded while playing.
+    """
+
+    # surface of every loaded (path, with_alpha)
+    sprites = {}
+    # RotationAtlas of every (sprite, steps)
+    atlases = {}
+    # SpriteData of every (sprite path, hitbox path, scale)
+    sprite_datas = {}
+    # collision mask of every surface asked for with mask
+    masks = {}
+    # collision mask of every atlas surface, the masks of its subsurfaces are cut from it
+    atlas_masks = {}
+    # rect around the drawn pixels of every surface asked for with drawn_rect
+    drawn_rects = {}
+    sprite_hits = 0
+    sprite_misses = 0
 
     @staticmethod
     def load_sprite(path: str, with_alpha: bool = True) -> pygame.Surface:
         """Load sprite found from path and return the image."""
+        key = (path, with_alpha)
+        sprite = ImageLoader.sprites.get(key)
+        if sprite is not None:
+            ImageLoader.sprite_hits += 1
+            return sprite
+        ImageLoader.sprite_misses += 1
         loaded_sprite = load(Path(BASE_DIR) / path)
         if with_alpha:
-            return loaded_sprite.convert_alpha()
+            sprite = loaded_sprite.convert_alpha()
         else:
-            return loaded_sprite.convert()
\ No newline at end of file
+            sprite = loaded_sprite.convert()
+        ImageLoader.sprites[key] = sprite
+        return sprite
+
+    @staticmethod
+    def rotation_atlas(sprite: pygame.Surface, steps: int = ROTATION_FRAMES) -> RotationAtlas:
+        """Return the RotationAtlas of sprite, made the first time it is asked for."""
+        key = (sprite, steps)
+        atlas = ImageLoader.atlases.get(key)
+        if atlas is None:
+            atlas = ImageLoader.atlases[key] = RotationAtlas(sprite, steps)
+        return atlas
+
+    @staticmethod
+    def sprite_data(sprite: str, hitbox: str, scale: float = 1.0) -> SpriteData:
+        """Return the SpriteData of a sprite and hitbox image, both scaled by
+        'scale', made the first time it is asked for."""
+        key = (sprite, hitbox, scale)
+        data = ImageLoader.sprite_datas.get(key)
+        if data is None:
+            surface = scale_sprite(ImageLoader.load_sprite(sprite), scale)
+            rect = scale_rect(ImageLoader.load_sprite(hitbox).get_rect(), scale)
+            data = ImageLoader.sprite_datas[key] = SpriteData(surface, rect)
+        return data
+
+    @staticmethod
+    def mask(sprite: pygame.Surface) -> pygame.mask.Mask:
+        """Return the collision mask of the drawn pixels of sprite, made the
+        first time it is asked for. Meant for loaded sprites and atlas frames,
+        which never change. Frames of an atlas in atlas_masks get the part of
+        its mask under them."""
+        mask = ImageLoader.masks.get(sprite)
+        if mask is None:
+            atlas_mask = ImageLoader.atlas_masks.get(sprite.get_parent())
+            if atlas_mask is None:
+                mask = pygame.mask.from_surface(sprite)
+            else:
+                mask = mask_part(atlas_mask, sprite.get_offset(), sprite.get_size())
+            ImageLoader.masks[sprite] = mask
+        return mask
+
+    @staticmethod
+    def drawn_rect(sprite: pygame.Surface) -> pygame.Rect:
+        """Return the rect around the drawn pixels of sprite, relative to its
+        top left corner. The rect is shared, so it must be copied to change it."""
+        rect = ImageLoader.drawn_rects.get(sprite)
+        if rect is None:
+            rects = ImageLoader.mask(sprite).get_bounding_rects()
+            rect = rects[0].unionall(rects[1:]) if rects else pygame.Rect(0, 0, 0, 0)
+            ImageLoader.drawn_rects[sprite] = rect
+        return rect
+
+    @staticmethod
+    def clear() -> None:
+        """Forget every cached surface, atlas, mask and rect."""
+        for cache in (
+            ImageLoader.sprites, ImageLoader.atlases, ImageLoader.sprite_datas,
+            ImageLoader.masks, ImageLoader.atlas_masks, ImageLoader.drawn_rects,
+        ):
+            cache.clear()
+
+    @staticmethod
+    def cache_info() -> dict:
+        """Return the hits, misses and size of the sprite cache and the size of the others."""
+        return {
+            "sprite_hits": ImageLoader.sprite_hits,
+            "sprite_misses": ImageLoader.sprite_misses,
+            "sprites": len(ImageLoader.sprites),
+            "atlases": len(ImageLoader.atlases),
+            "masks": len(ImageLoader.masks),
+            "sprite_datas": len(ImageLoader.sprite_datas),
+        }
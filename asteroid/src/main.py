@@ -1,9 +1,22 @@
 from typing import List
+import argparse
+import os
+import sys
 import pygame
 import math
 import random
+import time
+
+# frame_profiler.py is shared by all the games
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "shared"))
+
+from frame_profiler import FrameProfiler
 from image_loader import ImageLoader
+from assets import ATLAS_CACHE, AssetRegistry
 from background import Background
+from collisions import Collisions
+from projectiles import ProjectilePool
+from recording import Recorder
 
 """
 Explanation of coordinate system:
@@ -27,79 +40,96 @@ SCREEN_WIDTH = 960
 SCREEN_HEIGHT = 720
 FRAME_RATE = 60
 
-APPROX_TIME_PER_FRAME = round(1 / FRAME_RATE, 3)
-
-# These constants are used a lot, so it seems faster to not have to multiply them by delta time every frame.
-ROTATION_SPEED = 200 * APPROX_TIME_PER_FRAME
-CONSTANT_DECELERATION = 1 * APPROX_TIME_PER_FRAME
-MAX_SPEED = 300 * APPROX_TIME_PER_FRAME
-VELOCITY_INCREASE_ON_KEYPRESS = 10 * APPROX_TIME_PER_FRAME
+# The game logic always advances in ticks of the same length, however fast
+# the screen is drawn, so the game runs at the same speed on every machine.
+TICK_RATE = 60
+TIME_PER_TICK = 1 / TICK_RATE
+# longest frame the ticks try to catch up with, so a long pause doesn't make
+# the game run every tick it missed at once
+MAX_FRAME_TIME = 0.25
+
+# Speeds are per tick, so they are multiplied by the length of a tick once here.
+ROTATION_SPEED = 200 * TIME_PER_TICK
+CONSTANT_DECELERATION = 1 * TIME_PER_TICK
+MAX_SPEED = 300 * TIME_PER_TICK
+VELOCITY_INCREASE_ON_KEYPRESS = 10 * TIME_PER_TICK
 SPAWN_ASTROID = pygame.USEREVENT + 1
-
-
-def rot_center(image, angle):
-    """
-    Rotate an image while keeping its center and size.
-    https://www.pygame.org/wiki/RotateCenter?parent=CookBook
-    """
-    orig_rect = image.get_rect()
-    rot_image = pygame.transform.rotate(image, angle)
-    rot_rect = orig_rect.copy()
-    rot_rect.center = rot_image.get_rect().center
-    rot_image = rot_image.subsurface(rot_rect).copy()
-    return rot_image
-
-
-class Projectile:
-    __slots__ = ("pos", "direction", "velocity_vector", "rotation", "sprite", "cleanup")
-
-    def __init__(self, pos, direction, velocity_vector, rotation):
-        self.pos = pos.copy()
-        self.direction = direction
-        self.velocity_vector = velocity_vector.copy()
-        self.cleanup = False
-        self.sprite = rot_center(
-            ImageLoader.load_sprite("assets/projectile.png"), rotation
-        )
+# ticks between asteroid spawns, 2.5 seconds
+SPAWN_TICKS = round(2.5 * TICK_RATE)
+# times an asteroid breaks into smaller fragments when shot before it is destroyed
+ASTEROID_SPLITS = 2
+# fragments an asteroid breaks into
+FRAGMENTS = 2
+ASTEROID_SPEED = 0.8
+# how much faster each smaller fragment flies
+FRAGMENT_SPEEDUP = 1.5
+# (sprite, hitbox, scale) of every kind of entity, loaded into the asset atlas when the game starts
+SPRITE_KINDS = [
+    ("assets/ship.png", "assets/shiphitbox.png", 1.0),
+    ("assets/projectile.png", None, 1.0),
+] + [
+    ("assets/asteroid.png", "assets/asteroidhitbox.png", 0.5 ** (ASTEROID_SPLITS - splits))
+    for splits in range(ASTEROID_SPLITS, -1, -1)
+]
+# sections of a frame timed by the profiler, F3 shows them
+PROFILED_SECTIONS = ("input", "logic", "background", "ship", "projectiles", "asteroids", "flip", "wait")
 
 
 class Entity:
     __slots__ = (
         "screen",
         "pos",
-        "sprite",
+        "prev_pos",
+        "kind",
+        "frame",
         "displayed_sprite",
-        "hitbox",
+        "splits",
         "direction",
         "velocity_vector",
         "total_sprite_rotation",
     )
 
-    def __init__(self, screen, sprite, hitbox):
+    def __init__(self, screen, sprite, hitbox, scale: float = 1.0, splits: int = 0):
         """
-        Init entity with screen size, image representation, hit box, starting coordinates, start direction,
-        velocity vector, and total sprite rotation.
+        Init entity with screen size, image representation, hit box, size, times it can split, starting coordinates,
+        start direction, velocity vector, and total sprite rotation.
         """
         self.screen = screen
-        # the sprite has to be square to allow rotation around its center, so the hitbox is an image with smaller dimensions
-        self.sprite = ImageLoader.load_sprite(sprite)
+        # the sprite has to be square to allow rotation around its center, so the hitbox is an image with smaller dimensions.
+        # sprite, hitbox and every rotation of the sprite are shared by all entities that look the same
+        self.kind = ImageLoader.sprite_data(sprite, hitbox, scale)
+        self.frame = 0  # index of the displayed frame of the atlas
         self.displayed_sprite = (
             self.sprite
         )  # this variable allows the original sprite to be maintained when the entity rotates
-        self.hitbox = ImageLoader.load_sprite(hitbox).get_rect()
+        self.splits = splits  # times the entity breaks into fragments before it is destroyed
 
         starting_x = (screen.get_width() / 2) - self.sprite.get_rect().centerx
         starting_y = (screen.get_height() / 2) - self.sprite.get_rect().centery
         self.pos = pygame.Vector2(starting_x, starting_y)
+        self.prev_pos = self.pos.copy()  # position before the last move, to draw in between
         self.direction = (
             math.pi / 2
         )  # radians. should be the same starting angle of the sprite
         self.velocity_vector = pygame.Vector2(0, 0)
         self.total_sprite_rotation = 0  # degrees
 
+    @property
+    def sprite(self) -> pygame.Surface:
+        return self.kind.sprite
+
+    @property
+    def atlas(self):
+        return self.kind.atlas
+
+    @property
+    def hitbox(self) -> pygame.Rect:
+        return self.kind.hitbox
+
     def rotate_sprite(self):
-        """Rotate sprite."""
-        self.displayed_sprite = rot_center(self.sprite, self.total_sprite_rotation)
+        """Rotate sprite by picking the atlas frame closest to its rotation."""
+        self.frame = self.atlas.index(self.total_sprite_rotation)
+        self.displayed_sprite = self.atlas.frames[self.frame]
 
     def rotate(self, angle: float | int):
         """Rotate entity 'angle' degrees"""
@@ -123,8 +153,17 @@ class Entity:
 
     def move(self):
         """Moves the ship by its velocity."""
+        self.prev_pos.update(self.pos)
         self.pos += self.velocity_vector
 
+    def render_pos(self, alpha: float) -> pygame.Vector2:
+        """Position to draw the entity at, 'alpha' of the way from its
+        previous position to its current one. An entity that wrapped around
+        the screen is drawn where it is now."""
+        if self.prev_pos.distance_squared_to(self.pos) > SCREEN_HEIGHT * SCREEN_HEIGHT / 4:
+            return self.pos
+        return self.prev_pos.lerp(self.pos, alpha)
+
     def calc_drag(self, magnitude: float | int) -> pygame.Vector2:
         """Find a vector that's the opposite of the entity's velocity vector in order t"""
         if self.velocity_vector.magnitude() > 0:
@@ -140,6 +179,11 @@ class Entity:
         drag_vector = self.calc_drag(magnitude)
         self.velocity_vector += drag_vector
 
+    def hitbox_rect(self) -> pygame.Rect:
+        """Return the hitbox where the entity is now. The hitbox is centered on
+        the sprite and grown to fit around it when the entity is rotated."""
+        return self.kind.hitboxes[self.frame].move(int(self.pos[0]), int(self.pos[1]))
+
     def keep_within_borders(self):
         # have to use hitbox in some cases because center of pos is on the top left of entity sprite
         pad = 10
@@ -158,120 +202,282 @@ class Entity:
 
 
 class Game:
-    """Game class encapsulates functionality to make the game run."""
+    """Game class encapsulates functionality to make the game run.
+
+    The game logic advances in fixed ticks of TIME_PER_TICK seconds, as many
+    as fit in the time that passed, and the screen is drawn in between the
+    last two ticks so movement stays smooth at any frame rate.
+
+    Everything random in the game logic comes from rng, seeded with seed, so
+    a game can be replayed exactly from the seed and the keys held every
+    frame, which a recorder (see replay.py) writes down. The stars have their
+    own generator derived from the seed, so drawing them with or without
+    parallax never changes the game. With parallax the stars scroll in
+    layers as the ship moves. With
+    dirty_rects only the parts of the screen that entities covered last frame
+    or cover now are redrawn and updated, instead of the whole screen, which
+    needs a background that doesn't move.
+    """
 
-    __slots__ = "screen", "background", "dt", "clock", "ship", "projectiles", "asteroids"
+    __slots__ = (
+        "screen", "background", "dt", "clock", "ship", "projectiles", "asteroids", "collisions",
+        "dirty_rects", "drawn", "keys", "ticks", "seed", "rng", "recorder", "profiler", "assets",
+    )
 
-    def __init__(self, title: str = "NSCCSC Asteroid Clone") -> None:
+    def __init__(
+            self,
+            title: str = "NSCCSC Asteroid Clone",
+            parallax: bool = False,
+            dirty_rects: bool = False,
+            seed: int | None = None,
+            atlas_cache: str | None = ATLAS_CACHE,
+            profile_path: str | None = None,
+    ) -> None:
         """Init Game with initial pygame, display caption, and display size."""
+        if parallax and dirty_rects:
+            raise ValueError("dirty_rects needs a background without parallax")
         pygame.init()
         pygame.display.set_caption(title)
         self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-        self.screen.fill((0, 0, 0))
-        self.background = Background(self.screen)
+        # every sprite is loaded up front, from the atlas cache file when there is one
+        self.assets = AssetRegistry(SPRITE_KINDS, atlas_cache)
+        self.assets.load()
+        self.seed = random.randrange(1 << 32) if seed is None else seed
+        self.rng = random.Random(self.seed)
+        # gets the keys and ticks of every frame when set, see replay.Recorder
+        self.recorder = None
+        # with profile_path every frame is timed and written there on exit
+        self.profiler = FrameProfiler(PROFILED_SECTIONS, export_path=profile_path)
+        self.background = Background(self.screen, parallax, random.Random(f"{self.seed} stars"))
         self.background.create_stars(200)
+        self.background.draw_stars()
+        pygame.display.flip()
+        self.dirty_rects = dirty_rects
+        # rects entities were drawn over last frame, used with dirty_rects
+        self.drawn = []
         self.dt = 0  # delta time
         self.clock = pygame.time.Clock()
         self.ship = Entity(self.screen, "assets/ship.png", "assets/shiphitbox.png")
-        self.projectiles: List[Projectile] = []
+        self.projectiles = ProjectilePool()
         self.asteroids: List[Entity] = []
+        self.collisions = Collisions()
+        # keys held down, read once a frame by handle_input and used by every tick
+        self.keys = pygame.key.get_pressed()
+        self.ticks = 0  # ticks the game logic has advanced
 
     def run(self) -> None:
-        pygame.time.set_timer(SPAWN_ASTROID, 2500)
+        # time that passed but hasn't been advanced with ticks yet
+        accumulator = 0.0
+        profiler = self.profiler
         while True:
-            self.handle_input()
-            self.process_game_logic()
-            self.draw_game_elements()
+            with profiler.section("input"):
+                self.handle_input()
+            accumulator += min(self.dt, MAX_FRAME_TIME)
+            ticks = 0
+            with profiler.section("logic"):
+                while accumulator >= TIME_PER_TICK:
+                    self.process_game_logic()
+                    accumulator -= TIME_PER_TICK
+                    ticks += 1
+            if self.recorder is not None:
+                self.recorder.record_frame(self.keys, ticks)
+            # how far the time is between the last tick and the next one
+            self.draw_game_elements(accumulator / TIME_PER_TICK)
 
             # use delta time, which is the amount of time that has passed between each frame.
-            # this allows behaviour like velocity to be based on actual time passed instead of the amount of frames.
+            # this decides how many ticks the game logic advances before the next frame.
             seconds_per_millisecond = 1000
-            self.dt = (
-                self.clock.tick(FRAME_RATE) / seconds_per_millisecond
-            )  # NOTE: not currently used
+            with profiler.section("wait"):
+                self.dt = self.clock.tick(FRAME_RATE) / seconds_per_millisecond
+            profiler.end_frame()
+
+    def fast_forward(self, ticks: int) -> float:
+        """Advance the game logic 'ticks' ticks as fast as possible without
+        drawing anything, and return how many seconds that took."""
+        start = time.perf_counter()
+        for _ in range(ticks):
+            self.handle_input()
+            self.process_game_logic()
+        return time.perf_counter() - start
 
     def handle_input(self):
-        keys = pygame.key.get_pressed()
         for event in pygame.event.get():
             if event.type == pygame.QUIT:
-                pygame.quit()
-                quit()
+                self.quit()
             if event.type == SPAWN_ASTROID:
-                asteroid = Entity(
-                    self.screen, "assets/asteroid.png", "assets/asteroidhitbox.png"
-                )
-
-                asteroid.pos = (
-                    random.randint(0, SCREEN_WIDTH),
-                    random.randint(0, SCREEN_HEIGHT),
-                )
-                asteroid.rotate(random.randint(0, 359))
-                asteroid.add_forward_velocity(0.8)
-                self.asteroids.append(asteroid)
+                self.spawn_asteroid()
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                self.profiler.toggle_overlay()
 
         # check for keys within get_pressed() to continuously check which keys are pressed
-        keys = pygame.key.get_pressed()
+        self.keys = pygame.key.get_pressed()
+        if self.keys[pygame.K_ESCAPE] or self.keys[pygame.K_q]:
+            self.quit()
+
+    def quit(self):
+        """Finish the recording if there is one and exit."""
+        if self.recorder is not None:
+            self.recorder.close()
+        pygame.quit()
+        quit()
+
+    def spawn_asteroid(self, center=None, splits: int = ASTEROID_SPLITS):
+        """Add an asteroid flying in a random direction centered on center, or
+        somewhere on the screen. Asteroids that split fewer times are smaller
+        and faster."""
+        size = 0.5 ** (ASTEROID_SPLITS - splits)
+        asteroid = Entity(
+            self.screen, "assets/asteroid.png", "assets/asteroidhitbox.png", size, splits
+        )
+
+        if center is None:
+            asteroid.pos = pygame.Vector2(
+                self.rng.randint(0, SCREEN_WIDTH),
+                self.rng.randint(0, SCREEN_HEIGHT),
+            )
+        else:
+            asteroid.pos = pygame.Vector2(center) - pygame.Vector2(asteroid.sprite.get_size()) / 2
+        asteroid.prev_pos = asteroid.pos.copy()
+        asteroid.rotate(self.rng.randint(0, 359))
+        asteroid.add_forward_velocity(ASTEROID_SPEED * FRAGMENT_SPEEDUP ** (ASTEROID_SPLITS - splits))
+        self.asteroids.append(asteroid)
+
+    def stress(self, count: int):
+        """Spawn 'count' asteroids at once, to see how the game copes with a lot of them.
+        They are spawned right away, the event queue can't hold more than 65535 spawn events."""
+        for _ in range(count):
+            self.spawn_asteroid()
+
+    def control_ship(self):
+        """Fire, accelerate and turn the ship with the keys held down."""
+        keys = self.keys
         if keys[pygame.K_SPACE]:
-            self.projectiles.append(
-                Projectile(
-                    self.ship.pos,
-                    self.ship.direction,
-                    self.ship.calc_forward_facing_velocity(3),
-                    self.ship.total_sprite_rotation,
-                )
+            self.projectiles.spawn(
+                self.ship.pos,
+                self.ship.calc_forward_facing_velocity(3),
+                self.ship.total_sprite_rotation,
             )
         if keys[pygame.K_w]:
-            # multiply by dt to make the increase based on the amount of time that has passed between frames
             self.ship.add_forward_velocity(VELOCITY_INCREASE_ON_KEYPRESS)
         if keys[pygame.K_LEFT]:
             self.ship.rotate(ROTATION_SPEED)
         if keys[pygame.K_RIGHT]:
             self.ship.rotate(-1 * ROTATION_SPEED)
-        if keys[pygame.K_ESCAPE] or keys[pygame.K_q]:
-            pygame.quit()
-            quit()
 
     def process_game_logic(self):
+        """Advance the game one tick."""
+        self.ticks += 1
+        if self.ticks % SPAWN_TICKS == 0:
+            self.spawn_asteroid()
+        self.control_ship()
         self.ship.move()
         self.ship.slow_down(CONSTANT_DECELERATION)
         self.ship.keep_within_borders()
-        self.move_projectiles()
+        self.background.scroll(self.ship.velocity_vector)
+        self.projectiles.update(SCREEN_WIDTH, SCREEN_HEIGHT)
         self.move_asteroids()
-
-    def draw_game_elements(self):
-        self.screen.fill((0, 0, 0))
-        self.background.draw_stars()
-        self.screen.blit(self.ship.displayed_sprite, self.ship.pos)
-        self.draw_projectiles()
-        self.draw_asteroids()
-        pygame.display.flip()
+        self.handle_collisions()
+
+    def handle_collisions(self):
+        """Destroy asteroids hit by a projectile or the ship. An asteroid that
+        is shot breaks into smaller fragments until it can't split anymore. A
+        projectile that hits is used up and a ship that hits starts over in
+        the middle."""
+        self.collisions.update(self.asteroids)
+        hits = self.collisions.projectile_hits(self.projectiles, self.asteroids)
+        self.projectiles.kill([slot for slot, _ in hits])
+        shot = {i for _, i in hits}
+        destroyed = set(shot)
+        i = self.collisions.hit(
+            self.ship.displayed_sprite, self.ship.pos, self.asteroids, self.ship.hitbox_rect()
+        )
+        if i is not None:
+            destroyed.add(i)
+            self.ship = Entity(self.screen, "assets/ship.png", "assets/shiphitbox.png")
+        if destroyed:
+            asteroids = self.asteroids
+            self.asteroids = [a for i, a in enumerate(asteroids) if i not in destroyed]
+            for i in sorted(shot):
+                asteroid = asteroids[i]
+                if asteroid.splits > 0:
+                    center = asteroid.hitbox_rect().center
+                    for _ in range(FRAGMENTS):
+                        self.spawn_asteroid(center, asteroid.splits - 1)
+
+    def draw_game_elements(self, alpha: float = 1.0):
+        """Draw everything 'alpha' of the way from the previous tick to the last one."""
+        profiler = self.profiler
+        with profiler.section("background"):
+            if self.dirty_rects:
+                # erase what was drawn last frame, then update only those
+                # places and the ones drawn now
+                self.background.restore(self.drawn)
+            else:
+                self.background.draw_stars()
+        with profiler.section("ship"):
+            drawn = [self.screen.blit(self.ship.displayed_sprite, self.ship.render_pos(alpha))]
+        with profiler.section("projectiles"):
+            projectile_rects = self.projectiles.draw(self.screen, doreturn=self.dirty_rects, alpha=alpha)
+        with profiler.section("asteroids"):
+            asteroid_rects = self.draw_asteroids(alpha, self.dirty_rects)
+        overlay = profiler.draw_overlay(self.screen)
+        with profiler.section("flip"):
+            if self.dirty_rects:
+                drawn += projectile_rects
+                drawn += asteroid_rects
+                if overlay is not None:
+                    drawn.append(overlay)
+                pygame.display.update(self.drawn + drawn)
+                self.drawn = drawn
+            else:
+                pygame.display.flip()
 
     def move_asteroids(self):
         for a in self.asteroids:
             a.move()
             a.keep_within_borders()
 
-    def draw_asteroids(self):
-        for a in self.asteroids:
-            self.screen.blit(a.sprite, a.pos)
-
-    def move_projectiles(self):
-        for p in self.projectiles:
-            if p.pos.x < 0 or p.pos.x > SCREEN_WIDTH:
-                p.cleanup = True
-            elif p.pos.y < 0 or p.pos.y > SCREEN_HEIGHT:
-                p.cleanup = True
-            p.pos += p.velocity_vector
-
-    def cleanup_projectiles(self):
-        self.projectiles = list(filter(lambda p: p.cleanup == False, self.projectiles))
-
-    def draw_projectiles(self):
-        self.cleanup_projectiles()
-        for p in self.projectiles:
-            self.screen.blit(p.sprite, p.pos)
+    def draw_asteroids(self, alpha: float = 1.0, doreturn: bool = False):
+        """Draw every asteroid with a single blits call. With doreturn the
+        rects they were drawn over are returned."""
+        return self.screen.blits(
+            [(a.displayed_sprite, a.render_pos(alpha)) for a in self.asteroids], doreturn=doreturn
+        )
 
 
 if __name__ == "__main__":
-    game = Game()
-    game.run()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="NSCCSC Asteroid Clone")
+    parser.add_argument("--parallax", action="store_true", help="scroll the stars in layers as the ship moves")
+    parser.add_argument(
+        "--dirty-rects", action="store_true", help="only redraw the parts of the screen that changed"
+    )
+    parser.add_argument(
+        "--fast-forward", type=int, metavar="TICKS",
+        help="run TICKS ticks of game logic without a window as fast as possible and print how long it took"
+    )
+    parser.add_argument("--seed", type=int, help="seed of everything random, random by default")
+    parser.add_argument("--record", metavar="PATH", help="record the game to PATH to replay it with src/replay.py")
+    parser.add_argument(
+        "--profile", metavar="PATH", help="time every frame and write the last frames to PATH (.csv or .json) on exit"
+    )
+    parser.add_argument("--stress", type=int, metavar="COUNT", help="spawn COUNT asteroids at the start")
+    parser.add_argument(
+        "--no-atlas-cache", action="store_true", help="decode the assets instead of reading or writing the atlas cache"
+    )
+    args = parser.parse_args()
+    if args.fast_forward is not None:
+        os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+    game = Game(
+        parallax=args.parallax, dirty_rects=args.dirty_rects, seed=args.seed,
+        atlas_cache=None if args.no_atlas_cache else ATLAS_CACHE, profile_path=args.profile,
+    )
+    if args.record:
+        game.recorder = Recorder(args.record, game.seed, args.stress or 0)
+    if args.stress:
+        game.stress(args.stress)
+    if args.fast_forward is not None:
+        seconds = game.fast_forward(args.fast_forward)
+        print(f"{args.fast_forward} ticks in {seconds:.3f} s, {args.fast_forward / seconds:.0f} ticks per second")
+        pygame.quit()
+    else:
+        game.run()
\ No newline at end of file
@@ -0,0 +1,112 @@
+"""Projectiles kept in a fixed size pool of NumPy arrays.
+
+Instead of an object per projectile the pool has an array of positions, one
+of velocities, one of rotation frames and one saying which slots are in use.
+Moving and removing the projectiles that left the screen is a handful of
+whole array operations, and slots of removed projectiles are handed out again
+through a free list, so firing never makes the pool grow.
+"""
+import numpy as np
+import pygame
+
+from image_loader import ImageLoader
+
+# projectiles that can exist at the same time, firing does nothing once they are all used
+MAX_PROJECTILES = 16384
+
+
+class ProjectilePool:
+    """Fixed capacity pool of projectiles stored as structure of arrays."""
+
+    __slots__ = (
+        'capacity', 'atlas', 'cropped', 'offsets', 'pos', 'prev_pos', 'velocity', 'frame', 'alive', 'free',
+        'outside', 'scratch',
+    )
+
+    def __init__(self, capacity: int = MAX_PROJECTILES, sprite: str = "assets/projectile.png") -> None:
+        """Init an empty pool of 'capacity' slots drawn with the rotations of sprite."""
+        self.capacity = capacity
+        self.atlas = ImageLoader.rotation_atlas(ImageLoader.load_sprite(sprite))
+        # the atlas frames cut down to their drawn pixels, which makes blitting
+        # them several times faster, and where each cut starts in its frame
+        rects = [ImageLoader.drawn_rect(frame) for frame in self.atlas.frames]
+        self.cropped = [frame.subsurface(rect).copy() for frame, rect in zip(self.atlas.frames, rects)]
+        self.offsets = np.array([rect.topleft for rect in rects], dtype=np.intp).reshape(-1, 2)
+        # x, y of the top left corner of every slot
+        self.pos = np.zeros((capacity, 2))
+        # positions before the last update, to draw in between
+        self.prev_pos = np.zeros((capacity, 2))
+        self.velocity = np.zeros((capacity, 2))
+        # index of the atlas frame every slot is drawn with
+        self.frame = np.zeros(capacity, dtype=np.intp)
+        self.alive = np.zeros(capacity, dtype=bool)
+        # unused slots, the last one is handed out first
+        self.free = list(range(capacity - 1, -1, -1))
+        # preallocated so update doesn't make new arrays every frame
+        self.outside = np.zeros(capacity, dtype=bool)
+        self.scratch = np.zeros(capacity, dtype=bool)
+
+    def __len__(self) -> int:
+        """Return the number of projectiles in use."""
+        return self.capacity - len(self.free)
+
+    def spawn(self, pos, velocity, rotation: float | int) -> int | None:
+        """Fire a projectile from pos with a velocity, drawn rotated 'rotation'
+        degrees. Return its slot, or None when the pool is full."""
+        if not self.free:
+            return None
+        slot = self.free.pop()
+        self.pos[slot] = pos
+        self.prev_pos[slot] = pos
+        self.velocity[slot] = velocity
+        self.frame[slot] = self.atlas.index(rotation)
+        self.alive[slot] = True
+        return slot
+
+    def kill(self, slots) -> None:
+        """Remove the projectiles in slots and free the slots."""
+        for slot in slots:
+            if self.alive[slot]:
+                self.alive[slot] = False
+                self.free.append(slot)
+
+    def update(self, width: int, height: int) -> None:
+        """Move every projectile by its velocity and remove the ones that
+        left the width x height screen."""
+        pos = self.pos
+        np.copyto(self.prev_pos, pos)
+        pos += self.velocity
+        outside = self.outside
+        scratch = self.scratch
+        np.less(pos[:, 0], 0, out=outside)
+        np.greater(pos[:, 0], width, out=scratch)
+        outside |= scratch
+        np.less(pos[:, 1], 0, out=scratch)
+        outside |= scratch
+        np.greater(pos[:, 1], height, out=scratch)
+        outside |= scratch
+        outside &= self.alive
+        if outside.any():
+            self.free.extend(np.flatnonzero(outside).tolist())
+            np.logical_not(outside, out=scratch)
+            self.alive &= scratch
+
+    def live(self) -> np.ndarray:
+        """Return the slots of the projectiles in use."""
+        return np.flatnonzero(self.alive)
+
+    def sprite(self, slot: int) -> pygame.Surface:
+        """Return the surface the projectile in slot is drawn with."""
+        return self.atlas.frames[self.frame[slot]]
+
+    def draw(self, screen: pygame.Surface, doreturn: bool = False, alpha: float = 1.0) -> list | None:
+        """Draw every projectile in use with a single blits call, 'alpha' of
+        the way from where they were before the last update to where they are
+        now. With doreturn the rects they were drawn over are returned."""
+        slots = self.live()
+        frame = self.frame[slots]
+        prev_pos = self.prev_pos[slots]
+        pos = (prev_pos + (self.pos[slots] - prev_pos) * alpha).astype(np.intp)
+        pos += self.offsets[frame]
+        cropped = self.cropped
+        return screen.blits(zip([cropped[f] for f in frame.tolist()], pos.tolist()), doreturn=doreturn)
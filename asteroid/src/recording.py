@@ -0,0 +1,77 @@
+"""Recording the input of a game so it can be replayed exactly.
+
+Everything random in a game comes from a generator seeded with Game.seed,
+and the game logic only advances in whole ticks, so a game is decided by its
+seed, the asteroids spawned at the start with --stress, and, for every
+frame, the keys held down and the number of ticks the logic advanced. A
+recording is a header with the seed and stress count followed by two bytes
+per frame: the held keys as bits of RECORDED_KEYS and the tick count.
+"""
+import struct
+
+import pygame
+
+RECORDING_MAGIC = b"ASTEROID"
+RECORDING_VERSION = 1
+# magic, version, seed, asteroids spawned at the start with Game.stress
+RECORDING_HEADER = struct.Struct("<8sIQI")
+FRAME = struct.Struct("<BB")
+
+# keys the game logic reads, bit i of the keys of a frame is RECORDED_KEYS[i]
+RECORDED_KEYS = (pygame.K_SPACE, pygame.K_w, pygame.K_LEFT, pygame.K_RIGHT)
+
+
+def key_bits(keys) -> int:
+    """Return the bits of the RECORDED_KEYS that are held in keys."""
+    bits = 0
+    for i, key in enumerate(RECORDED_KEYS):
+        if keys[key]:
+            bits |= 1 << i
+    return bits
+
+
+class RecordedKeys:
+    """Stands in for pygame.key.get_pressed() with the keys of a recorded frame."""
+
+    __slots__ = 'held'
+
+    def __init__(self, bits: int) -> None:
+        """Init with the bits of the held RECORDED_KEYS."""
+        self.held = frozenset(key for i, key in enumerate(RECORDED_KEYS) if bits >> i & 1)
+
+    def __getitem__(self, key: int) -> bool:
+        """Return whether key is held."""
+        return key in self.held
+
+
+class Recorder:
+    """Writes the keys and ticks of every frame of a game to a file."""
+
+    __slots__ = 'file'
+
+    def __init__(self, path: str, seed: int, stress: int = 0) -> None:
+        """Start a recording of a game seeded with seed that spawned 'stress'
+        asteroids at the start."""
+        self.file = open(path, "wb")
+        self.file.write(RECORDING_HEADER.pack(RECORDING_MAGIC, RECORDING_VERSION, seed, stress))
+
+    def record_frame(self, keys, ticks: int) -> None:
+        """Write the keys held and the ticks the logic advanced in a frame."""
+        # a frame never runs more than MAX_FRAME_TIME worth of ticks, far below 255
+        self.file.write(FRAME.pack(key_bits(keys), ticks))
+
+    def close(self) -> None:
+        """Finish the recording."""
+        self.file.close()
+
+
+def read_recording(path: str):
+    """Return the seed and stress count of a recording and a list of
+    (keys, ticks) of its frames, the keys as RecordedKeys."""
+    with open(path, "rb") as file:
+        magic, version, seed, stress = RECORDING_HEADER.unpack(file.read(RECORDING_HEADER.size))
+        if magic != RECORDING_MAGIC or version != RECORDING_VERSION:
+            raise ValueError(f"{path} is not a version {RECORDING_VERSION} recording")
+        data = file.read()
+    keys = [RecordedKeys(bits) for bits in range(1 << len(RECORDED_KEYS))]
+    return seed, stress, [(keys[bits], ticks) for bits, ticks in FRAME.iter_unpack(data)]
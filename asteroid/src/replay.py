@@ -0,0 +1,87 @@
+"""Replay a recorded game without a window and report how long frames took.
+
+Example:
+    python src/main.py --record game.rec
+    python src/replay.py game.rec
+
+The game is driven by the keys and ticks of every recorded frame, so each
+replay of a recording does exactly the same work. Prints a single JSON object
+with percentiles of the time spent in handle_input, process_game_logic and
+draw_game_elements per frame. With --max-p99-ms the exit status is 1 when the
+99th percentile of a whole frame is slower, to catch performance regressions
+with checked in recordings.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+# no display is needed, the game draws to an offscreen surface
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import pygame
+
+from benchmark import summary_ms
+from main import Game
+from recording import read_recording
+
+
+def replay(path, parallax=False, dirty_rects=False):
+    """Replay a recording and return the results as a dict."""
+    seed, stress, frames = read_recording(path)
+    game = Game(parallax=parallax, dirty_rects=dirty_rects, seed=seed)
+    # spawned before the first frame, like in the recorded game
+    game.stress(stress)
+    clock = time.perf_counter_ns
+    input_times = [0] * len(frames)
+    logic_times = [0] * len(frames)
+    draw_times = [0] * len(frames)
+    frame_times = [0] * len(frames)
+    for i, (keys, ticks) in enumerate(frames):
+        start = clock()
+        game.handle_input()
+        game.keys = keys
+        after_input = clock()
+        for _ in range(ticks):
+            game.process_game_logic()
+        after_logic = clock()
+        game.draw_game_elements()
+        end = clock()
+        input_times[i] = after_input - start
+        logic_times[i] = after_logic - after_input
+        draw_times[i] = end - after_logic
+        frame_times[i] = end - start
+    pygame.quit()
+
+    return {
+        "recording": path,
+        "seed": seed,
+        "stress": stress,
+        "frames": len(frames),
+        "ticks": game.ticks,
+        # the same for every replay of a recording
+        "final_state": {
+            "asteroids": len(game.asteroids),
+            "projectiles": len(game.projectiles),
+            "ship": [game.ship.pos.x, game.ship.pos.y],
+        },
+        "frame_ms": summary_ms(frame_times),
+        "handle_input_ms": summary_ms(input_times),
+        "process_game_logic_ms": summary_ms(logic_times),
+        "draw_game_elements_ms": summary_ms(draw_times),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a recorded asteroid game headless")
+    parser.add_argument("recording", help="file written with python src/main.py --record")
+    parser.add_argument("--parallax", action="store_true")
+    parser.add_argument("--dirty-rects", action="store_true")
+    parser.add_argument("--max-p99-ms", type=float, help="exit with status 1 when the p99 frame time is slower")
+    args = parser.parse_args()
+    results = replay(args.recording, args.parallax, args.dirty_rects)
+    print(json.dumps(results))
+    if args.max_p99_ms is not None and results["frame_ms"] and results["frame_ms"]["p99"] > args.max_p99_ms:
+        sys.exit(1)
@@ -0,0 +1,118 @@
+"""Run the Game of Life without a window and report how fast it was.
+
+Example:
+    python src/benchmark.py time_bomb --backend numpy --grid-len 500 --generations 1000 --offset 200
+
+Prints a single JSON object so results can be compared between backends or
+saved by build machines to catch performance regressions.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+# no display is needed, rendering goes to an offscreen surface
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+import pygame
+
+from config import SCREEN_SIZE, GRID_LEN
+from cycles import CycleDetector
+from main import BACKENDS
+# main.py puts the shared directory on the path
+from frame_profiler import percentile
+from presets import PRESETS
+from renderer import SurfaceRenderer
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
+
+
+def peak_memory_bytes():
+    """return the highest resident memory the process has used, if known"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # linux reports kilobytes, macOS reports bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def run(backend, preset, grid_len, generations, offsetx=0, offsety=0, render=None, fast_forward=False):
+    """Advance a preset for a number of generations and return the results as a dict.
+    render is None to skip drawing, "surface" to draw with SurfaceRenderer or
+    "rects" to draw every changed cell with draw_cells. With fast_forward the
+    generations left once the board repeats itself are skipped."""
+    start = time.perf_counter()
+    cells = BACKENDS[backend](grid_len)
+    startup = time.perf_counter() - start
+    cells.load_preset(preset, offsetx, offsety)
+    # only made when drawing, the renderer holds a grid_len x grid_len surface
+    screen = None if render is None else pygame.Surface((SCREEN_SIZE, SCREEN_SIZE))
+    renderer = SurfaceRenderer(screen, grid_len) if render == "surface" else None
+    detector = CycleDetector()
+
+    times = []
+    clock = time.perf_counter_ns
+    total_start = clock()
+    for _ in range(generations):
+        if fast_forward and detector.cycle is not None:
+            break
+        frame_start = clock()
+        cells.advance_generation()
+        if render == "surface":
+            renderer.draw(cells)
+        elif render == "rects":
+            cells.draw_cells(screen)
+        else:
+            # nothing draws the changes, so throw them away
+            cells.changing = cells.changing[:0]
+        times.append(clock() - frame_start)
+        detector.record(cells.generation, cells.board_hash)
+    if fast_forward:
+        detector.run_until(cells, generations)
+    total = (clock() - total_start) / 1e9
+
+    if hasattr(cells, "close"):
+        cells.close()
+
+    times.sort()
+    return {
+        "backend": backend,
+        "preset": preset,
+        "grid_len": grid_len,
+        "generations": generations,
+        "generations_stepped": len(times),
+        "cycle": {"start": detector.cycle[0], "period": detector.cycle[1]} if detector.cycle else None,
+        "render": render,
+        "startup_seconds": startup,
+        "total_seconds": total,
+        "generations_per_second": generations / total if total else None,
+        "peak_memory_bytes": peak_memory_bytes(),
+        "generation_ms": {
+            "p50": percentile(times, 0.50) / 1e6,
+            "p90": percentile(times, 0.90) / 1e6,
+            "p99": percentile(times, 0.99) / 1e6,
+            "max": times[-1] / 1e6,
+        } if times else None,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless Game of Life benchmark")
+    parser.add_argument("preset", help=f"one of {', '.join(PRESETS)}, an .rle or .cells file or a snapshot")
+    parser.add_argument("--backend", choices=BACKENDS, default="numpy")
+    parser.add_argument("--grid-len", type=int, default=GRID_LEN)
+    parser.add_argument("--generations", type=int, default=1000)
+    parser.add_argument("--offset", type=int, default=0, help="moves the preset right and down")
+    parser.add_argument(
+        "--render", choices=("surface", "rects"),
+        help="also draw every generation to an offscreen surface with SurfaceRenderer or draw_cells"
+    )
+    parser.add_argument("--fast-forward", action="store_true", help="skip the generations left once the board repeats")
+    args = parser.parse_args()
+    results = run(args.backend, args.preset, args.grid_len, args.generations, args.offset, args.offset, args.render, args.fast_forward)
+    print(json.dumps(results))
@@ -0,0 +1,222 @@
+import numpy as np
+
+from config import SCREEN_SIZE, GRID_LEN
+from cycles import zobrist_hash
+from numpy_cells import RULE_TABLE
+from patterns import ListChangesMixin, PatternMixin
+
+
+# width and height of a chunk in cells
+CHUNK_LEN = 64
+
+
+class ChunkedCells(ListChangesMixin, PatternMixin):
+    """Collection of cells in an unbounded universe made of chunks.
+
+    The universe is split into CHUNK_LEN x CHUNK_LEN chunks, each a NumPy
+    array indexed as chunk[x, y] and kept in a dict by chunk coordinates.
+    A chunk only exists while it has living cells or might get some next
+    generation, so memory and the time a generation takes grow with the
+    population instead of with the space the pattern covers. Nothing wraps
+    around. The part of the universe between viewport and viewport + grid_len
+    is what gets drawn, and pan moves it.
+    """
+    __slots__ = (
+        'chunks', 'pending', 'viewport', 'grid_len', 'visible', 'changing',
+        'scale', 'generation', 'board_hash',
+    )
+    unbounded = True
+
+    def __init__(self, grid_len: int = GRID_LEN, screen_size: int = SCREEN_SIZE):
+        """Make an empty universe with a grid_len wide viewport at (0, 0)"""
+        self.chunks = {}
+        # (n, 2) arrays of the locations set alive that get revived next generation
+        self.pending = []
+        # location of the top left cell of the viewport
+        self.viewport = (0, 0)
+        self.grid_len = grid_len
+        # locations of the living cells that are currently drawn in the viewport
+        self.visible = set()
+        # (location, is_alive) of the cells in the viewport that changed
+        self.changing = []
+        self.scale = screen_size / grid_len
+        self.generation = 0
+        # Zobrist hash of the living cells, see cycles.py
+        self.board_hash = 0
+
+    def set_alive(self, loc):
+        """set cell as alive the next time the generation advances"""
+        self.pending.append(np.array([loc], dtype=np.intp))
+
+    def set_alive_many(self, locations):
+        """set the cells at an (n, 2) array of locations as alive the next
+        time the generation advances"""
+        self.pending.append(locations)
+
+    def padded(self, cx, cy):
+        """return chunk cx, cy with a border of the cells of the chunks around it"""
+        chunks = self.chunks
+        pad = np.zeros((CHUNK_LEN + 2, CHUNK_LEN + 2), dtype=np.uint8)
+        center = chunks.get((cx, cy))
+        if center is not None:
+            pad[1:-1, 1:-1] = center
+        neighbor = chunks.get((cx - 1, cy))
+        if neighbor is not None:
+            pad[0, 1:-1] = neighbor[-1, :]
+        neighbor = chunks.get((cx + 1, cy))
+        if neighbor is not None:
+            pad[-1, 1:-1] = neighbor[0, :]
+        neighbor = chunks.get((cx, cy - 1))
+        if neighbor is not None:
+            pad[1:-1, 0] = neighbor[:, -1]
+        neighbor = chunks.get((cx, cy + 1))
+        if neighbor is not None:
+            pad[1:-1, -1] = neighbor[:, 0]
+        neighbor = chunks.get((cx - 1, cy - 1))
+        if neighbor is not None:
+            pad[0, 0] = neighbor[-1, -1]
+        neighbor = chunks.get((cx + 1, cy - 1))
+        if neighbor is not None:
+            pad[-1, 0] = neighbor[0, -1]
+        neighbor = chunks.get((cx - 1, cy + 1))
+        if neighbor is not None:
+            pad[0, -1] = neighbor[-1, 0]
+        neighbor = chunks.get((cx + 1, cy + 1))
+        if neighbor is not None:
+            pad[-1, -1] = neighbor[0, 0]
+        return pad
+
+    def candidates(self):
+        """return the chunks that can have living cells next generation, the
+        existing chunks plus empty ones next to a living cell on their edge"""
+        candidates = set(self.chunks)
+        for (cx, cy), chunk in self.chunks.items():
+            left = chunk[0, :].any()
+            right = chunk[-1, :].any()
+            top = chunk[:, 0].any()
+            bottom = chunk[:, -1].any()
+            if left:
+                candidates.add((cx - 1, cy))
+            if right:
+                candidates.add((cx + 1, cy))
+            if top:
+                candidates.add((cx, cy - 1))
+            if bottom:
+                candidates.add((cx, cy + 1))
+            if left or top:
+                candidates.add((cx - 1, cy - 1))
+            if right or top:
+                candidates.add((cx + 1, cy - 1))
+            if left or bottom:
+                candidates.add((cx - 1, cy + 1))
+            if right or bottom:
+                candidates.add((cx + 1, cy + 1))
+        return list(candidates)
+
+    def advance_generation(self):
+        """advance every chunk that can change at once, then free empty chunks"""
+        self.generation += 1
+        keys = self.candidates()
+        if keys:
+            pads = np.stack([self.padded(cx, cy) for cx, cy in keys])
+            old_chunks = pads[:, 1:-1, 1:-1]
+            columns = pads[:, :, :-2] + pads[:, :, 1:-1] + pads[:, :, 2:]
+            index = columns[:, :-2] + columns[:, 1:-1] + columns[:, 2:]
+            index += old_chunks * np.uint8(10)
+            new_chunks = RULE_TABLE.take(index)
+            alive = new_chunks.any(axis=(1, 2))
+            self.chunks = {key: new_chunks[i] for i, key in enumerate(keys) if alive[i]}
+
+            changed = np.argwhere(new_chunks != old_chunks)
+            origins = np.array(keys, dtype=np.intp) * CHUNK_LEN
+            locations = origins[changed[:, 0]] + changed[:, 1:]
+            self.record_changes(locations, new_chunks[changed[:, 0], changed[:, 1], changed[:, 2]])
+        if self.pending:
+            self.revive(np.concatenate(self.pending))
+            self.pending.clear()
+
+    def revive(self, locations):
+        """set the cells at an (n, 2) array of locations alive right away,
+        a chunk at a time"""
+        if not len(locations):
+            return
+        locations = np.unique(locations, axis=0)
+        keys = locations // CHUNK_LEN
+        # group the locations by chunk
+        order = np.lexsort((keys[:, 1], keys[:, 0]))
+        (locations, keys) = (locations[order], keys[order])
+        starts = np.flatnonzero(np.concatenate(([True], (keys[1:] != keys[:-1]).any(axis=1))))
+        ends = np.append(starts[1:], len(keys))
+        revived = []
+        for start, end in zip(starts.tolist(), ends.tolist()):
+            key = tuple(keys[start].tolist())
+            chunk = self.chunks.get(key)
+            if chunk is None:
+                chunk = self.chunks[key] = np.zeros((CHUNK_LEN, CHUNK_LEN), dtype=np.uint8)
+            inside = locations[start:end] % CHUNK_LEN
+            dead = chunk[inside[:, 0], inside[:, 1]] == 0
+            chunk[inside[:, 0], inside[:, 1]] = 1
+            revived.append(locations[start:end][dead])
+        revived = np.concatenate(revived)
+        self.record_changes(revived, np.ones(len(revived), dtype=np.uint8))
+
+    def record_changes(self, locations, alive):
+        """update the board hash and the viewport with changed cells given as
+        an (n, 2) array of locations and whether each of them is alive now"""
+        self.board_hash ^= zobrist_hash(locations)
+        (left, top) = self.viewport
+        locations = locations - (left, top)
+        inside = ((locations >= 0) & (locations < self.grid_len)).all(axis=1)
+        for loc, is_alive in zip(map(tuple, locations[inside].tolist()), alive[inside].tolist()):
+            if is_alive:
+                self.visible.add(loc)
+            else:
+                self.visible.discard(loc)
+            self.changing.append((loc, bool(is_alive)))
+
+    def export_viewport(self, left, top, width, height):
+        """return the locations of the living cells inside the given area"""
+        out = []
+        for cx in range(left // CHUNK_LEN, -(-(left + width) // CHUNK_LEN)):
+            for cy in range(top // CHUNK_LEN, -(-(top + height) // CHUNK_LEN)):
+                chunk = self.chunks.get((cx, cy))
+                if chunk is None:
+                    continue
+                for x, y in np.argwhere(chunk).tolist():
+                    x += cx * CHUNK_LEN
+                    y += cy * CHUNK_LEN
+                    if left <= x < left + width and top <= y < top + height:
+                        out.append((x, y))
+        return out
+
+    def pan(self, dx, dy):
+        """move the viewport dx cells right and dy cells down and find the
+        cells of the viewport that look different now"""
+        left = self.viewport[0] + dx
+        top = self.viewport[1] + dy
+        self.viewport = (left, top)
+        visible = {
+            (x - left, y - top)
+            for (x, y) in self.export_viewport(left, top, self.grid_len, self.grid_len)
+        }
+        self.changing += (
+            [(loc, True) for loc in visible - self.visible]
+            + [(loc, False) for loc in self.visible - visible]
+        )
+        self.visible = visible
+
+    def population(self):
+        """return the number of living cells in the whole universe"""
+        return sum(int(chunk.sum()) for chunk in self.chunks.values())
+
+    def live_locations(self):
+        """return the locations of the living cells in the viewport as an (n, 2) array"""
+        return np.array(sorted(self.visible), dtype=np.intp).reshape(-1, 2)
+
+    def universe_locations(self):
+        """return the locations of all the living cells in the universe as an (n, 2) array"""
+        locations = [
+            np.argwhere(chunk) + (cx * CHUNK_LEN, cy * CHUNK_LEN)
+            for (cx, cy), chunk in self.chunks.items()
+        ]
+        return np.concatenate(locations) if locations else np.empty((0, 2), dtype=np.intp)
@@ -0,0 +1,13 @@
+"""Constants shared by the game and the different cell backends."""
+
+SCREEN_SIZE = 1000
+
+# grid size is height and width of grid
+GRID_LEN = 500
+
+# frames drawn per second, the simulation runs separately at its own rate
+FRAME_RATE = 60
+# generations per second the simulation aims for, None runs it as fast as it can
+GENERATION_RATE = None
+# cells the viewport of an unbounded universe moves every frame an arrow key is held
+PAN_STEP = 4
@@ -0,0 +1,95 @@
+"""Detecting when a board settles into a cycle.
+
+Every backend keeps a Zobrist hash of its board in board_hash: every cell has a
+random 64 bit key and the hash is the XOR of the keys of the living cells, so
+it can be updated with one XOR whenever a cell is revived or killed. Two
+generations with the same hash have (apart from a 1 in 2**64 chance) the same
+board, and from then on the board repeats with the distance between them as
+its period.
+"""
+from collections import deque
+
+import numpy as np
+
+
+# generations remembered by CycleDetector, longer periods than this aren't found
+HISTORY_LEN = 4096
+
+MASK_64 = (1 << 64) - 1
+
+
+def zobrist_key(loc):
+    """return the 64 bit key of the cell at loc (splitmix64 of its location)"""
+    (x, y) = loc
+    z = ((y << 32) + x + 0x9E3779B97F4A7C15) & MASK_64
+    z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & MASK_64
+    z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & MASK_64
+    return z ^ (z >> 31)
+
+
+def zobrist_hash(locations):
+    """return the XOR of the keys of an (n, 2) array of locations, the same
+    keys as zobrist_key"""
+    if len(locations) == 0:
+        return 0
+    locations = locations.astype(np.uint64)
+    with np.errstate(over="ignore"):
+        z = (locations[:, 1] << np.uint64(32)) + locations[:, 0] + np.uint64(0x9E3779B97F4A7C15)
+        z = (z ^ (z >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+        z = (z ^ (z >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+        z ^= z >> np.uint64(31)
+    return int(np.bitwise_xor.reduce(z))
+
+
+class CycleDetector:
+    """Remembers the board hash of the last max_history generations and finds
+    the first generation whose board was seen before.
+
+    Once found, cycle is (start, period): the board of every generation from
+    start on repeats every period generations. A period of 1 is a board that
+    stopped changing.
+    """
+    __slots__ = 'max_history', 'seen', 'order', 'cycle'
+
+    def __init__(self, max_history: int = HISTORY_LEN):
+        self.max_history = max_history
+        # generation of every remembered board hash
+        self.seen = {}
+        # remembered hashes, oldest first, to forget them in order
+        self.order = deque()
+        self.cycle = None
+
+    def reset(self):
+        """forget everything, for when the board was changed by hand"""
+        self.seen.clear()
+        self.order.clear()
+        self.cycle = None
+
+    def record(self, generation, board_hash):
+        """remember the board hash of a generation and return the cycle, or
+        None while no cycle was found"""
+        if self.cycle is not None:
+            return self.cycle
+        start = self.seen.get(board_hash)
+        if start is not None:
+            self.cycle = (start, generation - start)
+            return self.cycle
+        self.seen[board_hash] = generation
+        self.order.append(board_hash)
+        if len(self.order) > self.max_history:
+            del self.seen[self.order.popleft()]
+        return None
+
+    def run_until(self, cells, generation):
+        """Advance cells to a generation. Once a cycle is found only the
+        generations needed to get to the same point of the cycle are advanced
+        and the generation counter jumps the rest of the way."""
+        while cells.generation < generation:
+            if self.cycle is not None:
+                period = self.cycle[1]
+                for _ in range((generation - cells.generation) % period):
+                    cells.advance_generation()
+                cells.generation = generation
+                break
+            cells.advance_generation()
+            self.record(cells.generation, cells.board_hash)
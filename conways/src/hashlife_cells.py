@@ -0,0 +1,313 @@
+import numpy as np
+
+from config import SCREEN_SIZE, GRID_LEN
+from cycles import zobrist_hash
+from patterns import ListChangesMixin, PatternMixin
+
+
+# Upper limit of nodes kept in the node table before unreachable nodes and
+# memoized results are thrown away.
+MAX_NODES = 1_000_000
+
+
+class Node:
+    """Square quadtree node 2**level cells wide.
+
+    Nodes are never changed after they are made and there is only ever one node
+    for every combination of children, so nodes can be compared and hashed by
+    identity. Children are laid out as:
+
+        a b
+        c d
+    """
+    __slots__ = 'level', 'a', 'b', 'c', 'd', 'population'
+
+    def __init__(self, level, a=None, b=None, c=None, d=None, population=0):
+        self.level = level
+        self.a = a
+        self.b = b
+        self.c = c
+        self.d = d
+        self.population = population
+
+
+# the two level 0 nodes, a single dead or living cell
+OFF = Node(0)
+ON = Node(0, population=1)
+
+
+class HashLifeCells(ListChangesMixin, PatternMixin):
+    """Collection of cells stored in a memoized quadtree (HashLife).
+
+    Identical parts of the pattern share the same node, and the future of every
+    node is remembered, so repeating patterns can be advanced 2**k generations
+    at a time with jump. Unlike the other backends the universe does not wrap
+    around, it grows as needed. The part of it between (0, 0) and
+    (grid_len, grid_len), moved by viewport, is what gets drawn.
+    """
+    __slots__ = (
+        'nodes', 'results', 'empties', 'root', 'origin', 'generation', 'max_nodes',
+        'pending', 'viewport', 'grid_len', 'visible', 'changing', 'scale', 'board_hash',
+    )
+    unbounded = True
+
+    def __init__(self, grid_len: int = GRID_LEN, screen_size: int = SCREEN_SIZE, max_nodes: int = MAX_NODES):
+        """Make an empty universe with a grid_len wide viewport at (0, 0)"""
+        # canonical node for every (a, b, c, d) combination of children
+        self.nodes = {}
+        # memoized results of step keyed by (node, log2 of the generations)
+        self.results = {}
+        # empty node of every level, indexed by level
+        self.empties = [OFF]
+        self.max_nodes = max_nodes
+        self.root = self.empty(3)
+        # location of the top left cell of root
+        self.origin = (0, 0)
+        self.generation = 0
+        # locations set alive with set_alive that get revived next generation
+        self.pending = []
+        # location of the top left cell of the viewport
+        self.viewport = (0, 0)
+        self.grid_len = grid_len
+        # locations of the living cells that are currently drawn in the viewport
+        self.visible = set()
+        # (location, is_alive) of the cells in the viewport that changed
+        self.changing = []
+        self.scale = screen_size / grid_len
+        # Zobrist hash of the living cells in the viewport, see cycles.py
+        self.board_hash = 0
+
+    def join(self, a, b, c, d):
+        """return the node with the four children a, b, c and d"""
+        key = (a, b, c, d)
+        node = self.nodes.get(key)
+        if node is None:
+            population = a.population + b.population + c.population + d.population
+            node = self.nodes[key] = Node(a.level + 1, a, b, c, d, population)
+        return node
+
+    def empty(self, level):
+        """return the node of the given level with no living cells"""
+        while len(self.empties) <= level:
+            e = self.empties[-1]
+            self.empties.append(self.join(e, e, e, e))
+        return self.empties[level]
+
+    def center(self, node):
+        """return the node one level down that covers the middle of node"""
+        return self.join(node.a.d, node.b.c, node.c.b, node.d.a)
+
+    def expand(self):
+        """grow the root one level keeping the old root in the middle"""
+        root = self.root
+        e = self.empty(root.level - 1)
+        self.root = self.join(
+            self.join(e, e, e, root.a),
+            self.join(e, e, root.b, e),
+            self.join(e, root.c, e, e),
+            self.join(root.d, e, e, e),
+        )
+        half = 1 << (root.level - 1)
+        self.origin = (self.origin[0] - half, self.origin[1] - half)
+
+    def set_alive(self, loc):
+        """set cell as alive the next time the generation advances"""
+        self.pending.append(loc)
+
+    def revive(self, loc):
+        """set the cell at loc alive right away, growing the root to fit it"""
+        (x, y) = loc
+        while True:
+            size = 1 << self.root.level
+            (ox, oy) = self.origin
+            if ox <= x < ox + size and oy <= y < oy + size:
+                break
+            self.expand()
+        self.root = self.set_cell(self.root, x - ox, y - oy)
+
+    def set_cell(self, node, x, y):
+        """return a copy of node with the cell at x, y (relative to node) alive"""
+        if node.level == 0:
+            return ON
+        half = 1 << (node.level - 1)
+        (a, b, c, d) = (node.a, node.b, node.c, node.d)
+        if y < half:
+            if x < half:
+                a = self.set_cell(a, x, y)
+            else:
+                b = self.set_cell(b, x - half, y)
+        elif x < half:
+            c = self.set_cell(c, x, y - half)
+        else:
+            d = self.set_cell(d, x - half, y - half)
+        return self.join(a, b, c, d)
+
+    def life_4x4(self, node):
+        """advance the middle 2x2 cells of a level 2 node one generation"""
+        cells = [
+            [node.a.a, node.a.b, node.b.a, node.b.b],
+            [node.a.c, node.a.d, node.b.c, node.b.d],
+            [node.c.a, node.c.b, node.d.a, node.d.b],
+            [node.c.c, node.c.d, node.d.c, node.d.d],
+        ]
+        result = []
+        for y in (1, 2):
+            for x in (1, 2):
+                living_neighbors = -cells[y][x].population
+                for row in cells[y - 1:y + 2]:
+                    for cell in row[x - 1:x + 2]:
+                        living_neighbors += cell.population
+                if living_neighbors == 3 or (living_neighbors == 2 and cells[y][x] is ON):
+                    result.append(ON)
+                else:
+                    result.append(OFF)
+        return self.join(*result)
+
+    def step(self, node, j):
+        """return the middle of node one level down advanced 2**j generations.
+        j can be at most node.level - 2"""
+        if node.population == 0:
+            return self.empty(node.level - 1)
+        key = (node, j)
+        result = self.results.get(key)
+        if result is not None:
+            return result
+        if node.level == 2:
+            result = self.life_4x4(node)
+        else:
+            join = self.join
+            (a, b, c, d) = (node.a, node.b, node.c, node.d)
+            # 9 overlapping nodes one level down covering node
+            n00 = a
+            n01 = join(a.b, b.a, a.d, b.c)
+            n02 = b
+            n10 = join(a.c, a.d, c.a, c.b)
+            n11 = join(a.d, b.c, c.b, d.a)
+            n12 = join(b.c, b.d, d.a, d.b)
+            n20 = c
+            n21 = join(c.b, d.a, c.d, d.c)
+            n22 = d
+            if j == node.level - 2:
+                # full speed, both halves advance 2**(j - 1) generations
+                (first, second) = (lambda n: self.step(n, j - 1)), j - 1
+            else:
+                # only the second half advances, the first just takes the middle
+                (first, second) = self.center, j
+            r00, r01, r02 = first(n00), first(n01), first(n02)
+            r10, r11, r12 = first(n10), first(n11), first(n12)
+            r20, r21, r22 = first(n20), first(n21), first(n22)
+            result = join(
+                self.step(join(r00, r01, r10, r11), second),
+                self.step(join(r01, r02, r11, r12), second),
+                self.step(join(r10, r11, r20, r21), second),
+                self.step(join(r11, r12, r21, r22), second),
+            )
+        self.results[key] = result
+        return result
+
+    def jump(self, k):
+        """advance the universe 2**k generations at once.
+        Like with advance_generation, cells set with set_alive show up after
+        the first generation, the rest are advanced as jumps of 2**(k-1) down
+        to 1 generations."""
+        if self.pending:
+            self.advance_generation()
+            # 1 + 2**0 + ... + 2**(k-1) == 2**k
+            for j in range(k):
+                self.leap(j)
+            return
+        self.leap(k)
+
+    def leap(self, k):
+        """advance the universe 2**k generations at once, leaving cells set
+        with set_alive pending"""
+        # the pattern has to sit in the middle quarter of the root with room to
+        # spare so nothing can grow past the edge of the result
+        while (self.root.level < k + 2
+               or self.center(self.center(self.root)).population != self.root.population):
+            self.expand()
+        self.expand()
+        quarter = 1 << (self.root.level - 2)
+        self.root = self.step(self.root, k)
+        self.origin = (self.origin[0] + quarter, self.origin[1] + quarter)
+        self.generation += 1 << k
+        if len(self.nodes) > self.max_nodes:
+            self.collect()
+        self.update_viewport()
+
+    def collect(self):
+        """drop memoized results and every node that root does not use"""
+        self.results.clear()
+        old_nodes = self.nodes
+        self.nodes = {}
+        stack = [self.root] + self.empties[1:]
+        while stack:
+            node = stack.pop()
+            if node.level == 0:
+                continue
+            key = (node.a, node.b, node.c, node.d)
+            if key not in self.nodes:
+                self.nodes[key] = node
+                stack.extend(key)
+        old_nodes.clear()
+
+    def advance_generation(self):
+        """advance one generation and remember which viewport cells changed"""
+        pending = self.pending
+        self.pending = []
+        self.leap(0)
+        if pending:
+            for loc in pending:
+                self.revive(loc)
+            self.update_viewport()
+
+    def export_viewport(self, left, top, width, height):
+        """return the locations of the living cells inside the given area"""
+        out = []
+        stack = [(self.root, self.origin[0], self.origin[1])]
+        right = left + width
+        bottom = top + height
+        while stack:
+            node, x, y = stack.pop()
+            size = 1 << node.level
+            if (node.population == 0 or x >= right or y >= bottom
+                    or x + size <= left or y + size <= top):
+                continue
+            if node.level == 0:
+                out.append((x, y))
+                continue
+            half = size >> 1
+            stack.append((node.a, x, y))
+            stack.append((node.b, x + half, y))
+            stack.append((node.c, x, y + half))
+            stack.append((node.d, x + half, y + half))
+        return out
+
+    def update_viewport(self):
+        """find the cells of the viewport that changed since it was last drawn"""
+        (left, top) = self.viewport
+        visible = {
+            (x - left, y - top)
+            for (x, y) in self.export_viewport(left, top, self.grid_len, self.grid_len)
+        }
+        changes = (
+            [(loc, True) for loc in visible - self.visible]
+            + [(loc, False) for loc in self.visible - visible]
+        )
+        self.changing += changes
+        self.visible = visible
+        self.board_hash ^= zobrist_hash(np.array([loc for loc, _ in changes], dtype=np.intp).reshape(-1, 2))
+
+    def pan(self, dx, dy):
+        """move the viewport dx cells right and dy cells down"""
+        self.viewport = (self.viewport[0] + dx, self.viewport[1] + dy)
+        self.update_viewport()
+
+    def live_locations(self):
+        """return the locations of the living cells in the viewport as an (n, 2) array"""
+        return np.array(sorted(self.visible), dtype=np.intp).reshape(-1, 2)
+
+    def universe_locations(self):
+        """return the locations of all the living cells in the universe as an (n, 2) array"""
+        size = 1 << self.root.level
+        return np.array(self.export_viewport(*self.origin, size, size), dtype=np.intp).reshape(-1, 2)
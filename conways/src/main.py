@@ -1,21 +1,28 @@
 #!python
+import argparse
+import os
+import sys
+import threading
+import time
+import numpy as np
 import pygame
 from enum import Enum
+from functools import lru_cache
 
+# frame_profiler.py is shared by all the games
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "shared"))
 
-PRESETS = {
-    "glider": [(5, 5), (6, 6), (6, 7), (5, 7), (4, 7)],
-    "spaceship": [(34, 20), (37, 20), (38, 20), (45, 20), (48, 20), (49, 20), (50, 20), (26, 21), (30, 21), (31, 21), (32, 21), (33, 21), (35, 21), (36, 21), (37, 21), (38, 21), (39, 21), (40, 21), (45, 21), (48, 21), (49, 21), (50, 21), (22, 22), (23, 22), (24, 22), (25, 22), (26, 22), (31, 22), (36, 22), (41, 22), (42, 22), (43, 22), (21, 23), (28, 23), (29, 23), (31, 23), (38, 23), (39, 23), (41, 23), (42, 23), (43, 23), (46, 23), (48, 23), (49, 23), (50, 23), (22, 24), (23, 24), (24, 24), (25, 24), (26, 24), (28, 24), (29, 24), (30, 24), (39, 24), (40, 24), (41, 24), (42, 24), (46, 24), (48, 24), (49, 24), (50, 24), (26, 25), (29, 25), (44, 25), (29, 26), (30, 26), (41, 26), (42, 26), (44, 26), (45, 26), (29, 27), (30, 27), (41, 27), (42, 27), (44, 27), (45, 27), (26, 28), (29, 28), (44, 28), (22, 29), (23, 29), (24, 29), (25, 29), (26, 29), (28, 29), (29, 29), (30, 29), (39, 29), (40, 29), (41, 29), (42, 29), (46, 29), (48, 29), (49, 29), (50, 29), (21, 30), (28, 30), (29, 30), (31, 30), (38, 30), (39, 30), (41, 30), (42, 30), (43, 30), (46, 30), (48, 30), (49, 30), (50, 30), (22, 31), (23, 31), (24, 31), (25, 31), (26, 31), (31, 31), (36, 31), (41, 31), (42, 31), (43, 31), (26, 32), (30, 32), (31, 32), (32, 32), (33, 32), (35, 32), (36, 32), (37, 32), (38, 32), (39, 32), (40, 32), (45, 32), (48, 32), (49, 32), (50, 32), (34, 33), (37, 33), (38, 33), (45, 33), (48, 33), (49, 33), (50, 33)],
-    "infinite_growth": [(7, 0), (5, 1), (7, 1), (8, 1), (5, 2), (7, 2), (5, 3), (3, 4), (1, 5), (3, 5)],
-    "time_bomb": [(2, 0), (14, 0), (15, 0), (1, 1), (3, 1), (8, 1), (15, 1), (8, 2), (13, 2), (3, 3), (6, 3), (10, 3), (13, 3), (3, 4), (4, 4), (11, 4), (4, 5)],
-}
-
-
-SCREEN_SIZE = 1000
-
-# grid size is height and width of grid
-GRID_LEN = 500
-GRID_LAST = GRID_LEN - 1
+from frame_profiler import FrameProfiler
+from config import SCREEN_SIZE, GRID_LEN, FRAME_RATE, GENERATION_RATE, PAN_STEP
+from chunked_cells import ChunkedCells
+from cycles import CycleDetector, zobrist_key
+from hashlife_cells import HashLifeCells
+from numpy_cells import NumpyCells
+from packed_cells import PackedCells
+from patterns import PatternMixin
+from renderer import SurfaceRenderer, merge_changes
+from sparse_cells import SparseCells
+from tiled_cells import TiledCells
 
 
 class OperationFlag(Enum):
@@ -26,34 +33,64 @@ class OperationFlag(Enum):
     KILL = 1
 
 
-class Cells(dict):
-    """Collection of Cells"""
-    __slots__ = 'changing', 'screen'
+@lru_cache
+def wrap_table(grid_len):
+    """Return the index before and after every index of a grid_len long axis,
+    wrapping around at the ends. Computed once per grid size and shared by
+    every Cell to find its neighbors."""
+    indices = np.arange(grid_len)
+    return np.roll(indices, 1).tolist(), np.roll(indices, -1).tolist()
 
-    def __init__(self, *arg, **kw):
-        """Make a grid of cells the size of GRID_LEN"""
-        super(Cells, self).__init__(*arg, **kw)
+
+class Cells(PatternMixin, dict):
+    """Collection of Cells
+
+    Cells are only made the first time they are looked up. A cell nobody has
+    looked up is dead with no living neighbors and can't change, so it doesn't
+    have to exist.
+    """
+    __slots__ = 'changing', 'grid_len', 'scale', 'generation', 'board_hash'
+
+    def __init__(self, grid_len: int = GRID_LEN, screen_size: int = SCREEN_SIZE):
+        """Make an empty grid of cells grid_len wide and high"""
+        super(Cells, self).__init__()
         self.changing = []
-        for y in range(GRID_LEN):
-            for x in range(GRID_LEN):
-                loc = (x, y)
-                self[loc] = self.cell(loc)
-
-    def cell(self, *arg, **kw):
-        """add cell to collection"""
-        cell = Cell(*arg, **kw)
+        self.grid_len = grid_len
+        self.scale = screen_size / grid_len
+        self.generation = 0
+        # Zobrist hash of the living cells, see cycles.py
+        self.board_hash = 0
+        wrap_table(grid_len)
+
+    def __missing__(self, loc):
+        """make the cell at loc the first time it is looked up"""
+        (x, y) = loc
+        if not (0 <= x < self.grid_len and 0 <= y < self.grid_len):
+            raise KeyError(loc)
+        cell = self[loc] = self.cell(loc)
         return cell
 
-    def load_preset(self, key, offsetx=0, offsety=0):
-        """load an array of points to set alive"""
-        try:
-            for (x, y) in PRESETS[key]:
-                self.set_alive((x + offsetx, y + offsety))
-        except KeyError:
-            print("KEYERROR: ", key)# maybe display error over game
+    def cell(self, loc):
+        """make a cell, finding its neighbors in the wrap table"""
+        (x, y) = loc
+        (before, after) = wrap_table(self.grid_len)
+        (left, right) = (before[x], after[x])
+        (top, bottom) = (before[y], after[y])
+        neighbors = [
+            (left, top),
+            (right, y),
+            (right, top),
+            (x, bottom),
+            (left, bottom),
+            (x, top),
+            (right, bottom),
+            (left, y),
+        ]
+        return Cell(loc, neighbors)
 
     def advance_generation(self):
         """process changing cells"""
+        self.generation += 1
         for cell in self.values():
             result = cell.update()
             if result is not None:
@@ -67,12 +104,24 @@ class Cells(dict):
 
     def draw_cells(self, screen):
         """Draw changing cells"""
-        updates = []
-        while len(self.changing) > 0:
-            cell, _ = self.changing.pop(0)
-            updates.append(cell.draw(screen))
+        updates = [cell.draw(screen, self.scale) for cell, _ in self.changing]
+        self.changing.clear()
         return updates
 
+    def live_locations(self):
+        """return the locations of the living cells as an (n, 2) array"""
+        locations = [loc for loc, cell in self.items() if cell.is_alive]
+        return np.array(locations, dtype=np.intp).reshape(-1, 2)
+
+    def pop_changes(self):
+        """return the locations of the cells that changed as an (n, 2) array
+        and whether each of them is alive now, then forget the changes"""
+        changing = self.changing
+        self.changing = []
+        locations = np.array([cell.location for cell, _ in changing], dtype=np.intp).reshape(-1, 2)
+        alive = np.array([cell.is_alive for cell, _ in changing], dtype=np.uint8)
+        return locations, alive
+
     def kill(self, cell):
         """kill cell and decrement living neighbor count of neighbors"""
         if cell.is_alive:
@@ -80,6 +129,7 @@ class Cells(dict):
                 if self[loc].living_neighbors > 0:
                     self[loc].living_neighbors -= 1
             cell.is_alive = False
+            self.board_hash ^= zobrist_key(cell.location)
 
     def set_alive(self, loc):
         """set cell as alive. Used for manual enabling. Maybe useful or User Input."""
@@ -91,6 +141,7 @@ class Cells(dict):
             for loc in cell.neighbors:
                 self[loc].living_neighbors += 1
             cell.is_alive = True
+            self.board_hash ^= zobrist_key(cell.location)
 
 
 class Cell(object):
@@ -99,64 +150,14 @@ class Cell(object):
     __slots__ = 'location', 'neighbors', 'living_neighbors', 'is_alive', 'rect'
     # location of cell and whether it is alive or dead
 
-    def __init__(self, location):
-        """cells are initialized with a location, their neighbors are located
-        at this time
+    def __init__(self, location, neighbors):
+        """cells are initialized with a location and the locations of their
+        neighbors, the rect is only made once the cell is drawn
         """
-        (x, y) = self.location = location
-
-        # calculate neighbor positions
-        ul_field = (x - 1, y - 1)
-        if x - 1 < 0 and y - 1 < 0:
-            ul_field = (GRID_LAST, GRID_LAST)
-        elif x - 1 < 0 and y - 1 >= 0:
-            ul_field = (GRID_LAST, y - 1)
-        elif x - 1 >= 0 and y - 1 < 0:
-            ul_field = (x - 1, GRID_LAST)
-
-        ur_field = (x + 1, y - 1)
-        if x + 1 > GRID_LAST and y - 1 < 0:
-            ur_field = (0, GRID_LAST)
-        elif x + 1 > GRID_LAST and y - 1 >= 0:
-            ur_field = (0, y - 1)
-        elif x + 1 <= GRID_LAST and y - 1 < 0:
-            ur_field = (x + 1, GRID_LAST)
-
-        bl_field = (x - 1, y + 1)
-        if x - 1 < 0 and y + 1 > GRID_LAST:
-            bl_field = (GRID_LAST, 0)
-        elif x - 1 < 0 and y + 1 <= GRID_LAST:
-            bl_field = (GRID_LAST, y + 1)
-        elif x - 1 >= 0 and y + 1 > GRID_LAST:
-            bl_field = (x - 1, 0)
-
-        br_field = (x + 1, y + 1)
-        if x + 1 > GRID_LAST and y + 1 > GRID_LAST:
-            br_field = (0, 0)
-        elif x + 1 > GRID_LAST and y + 1 <= GRID_LAST:
-            br_field = (0, y + 1)
-        elif x + 1 <= GRID_LAST and y + 1 > GRID_LAST:
-            br_field = (x + 1, 0)
-
-        right_field = (0, y) if x + 1 > GRID_LAST else (x + 1, y)
-        bottom_field = (x, 0) if y + 1 > GRID_LAST else (x, y + 1)
-        top_field = (x, GRID_LAST) if y - 1 < 0 else (x, y - 1)
-        left_field = (GRID_LAST, y) if x - 1 < 0 else (x - 1, y)
-
-        self.neighbors = [
-            ul_field,
-            right_field,
-            ur_field,
-            bottom_field,
-            bl_field,
-            top_field,
-            br_field,
-            left_field
-        ]
-
+        self.location = location
+        self.neighbors = neighbors
         self.is_alive = False
-        scale = SCREEN_SIZE/GRID_LEN
-        self.rect = pygame.Rect(x * scale, y * scale, scale, scale)
+        self.rect = None
         self.living_neighbors = 0
 
     def update(self):
@@ -166,50 +167,208 @@ class Cell(object):
         elif self.is_alive and (self.living_neighbors < 2 or self.living_neighbors > 3) :
             return (self, OperationFlag.KILL)
 
-    def draw(self, screen):
+    def draw(self, screen, scale):
         "draw self and return rect to be updated"
+        if self.rect is None:
+            (x, y) = self.location
+            self.rect = pygame.Rect(x * scale, y * scale, scale, scale)
         color = 0xffffff if self.is_alive else 0x000000
         pygame.draw.rect(screen, color, self.rect)
         return self.rect
 
 
+# cell collections that can run the game, selected with Game's backend argument
+BACKENDS = {
+    "cells": Cells,
+    "numpy": NumpyCells,
+    "sparse": SparseCells,
+    "hashlife": HashLifeCells,
+    "packed": PackedCells,
+    "tiled": TiledCells,
+    "chunked": ChunkedCells,
+}
+
+
+# sections of a frame timed by the profiler, F3 shows them. logic is the time
+# the simulation thread spent on the generations drawn in the frame, it runs
+# alongside the others so it isn't part of the frame's total
+PROFILED_SECTIONS = ("input", "logic", "draw", "display", "wait")
+# changes of generations kept for the next frame before the simulation
+# merges them into one, so they can't pile up while drawing is stalled
+MAX_QUEUED_CHANGES = 16
+
+
 class Game:
-    """ Game class handles the main loop and io."""
+    """ Game class handles the main loop and io.
+
+    The cells are advanced on a simulation thread at generation_rate
+    generations per second (as fast as possible when None), while the main
+    thread handles input and draws the latest finished generation at a fixed
+    frame rate. Generations finished between two frames are drawn together.
+    Once the board repeats itself the cycle is reported, and with
+    stop_on_cycle the simulation stops there. The arrow keys pan backends
+    that have a viewport, and F3 shows how long the parts of a frame take.
+    """
 
     # reference to initialized pygame screen
-    __slots__ = 'screen', 'cells'
-
-    def __init__(self, title: str = "NSCCSC Life Clone") -> None:
+    __slots__ = (
+        'screen', 'cells', 'renderer', 'clock', 'generation_rate',
+        'running', 'simulation', 'cells_lock', 'changes_lock', 'changes', 'logic_ns', 'detector', 'stop_on_cycle',
+        'profiler', 'overlay_rect',
+    )
+
+    def __init__(
+            self,
+            title: str = "NSCCSC Life Clone",
+            backend: str = "numpy",
+            generation_rate: float | None = GENERATION_RATE,
+            stop_on_cycle: bool = False,
+            profile_path: str | None = None,
+    ) -> None:
         # pygame setup
         pygame.init()
         pygame.display.set_caption(title)
         self.screen = pygame.display.set_mode((SCREEN_SIZE, SCREEN_SIZE))
+        self.clock = pygame.time.Clock()
         # Cells setup
-        self.cells = Cells()
+        self.cells = BACKENDS[backend]()
         self.cells.load_preset("time_bomb", 200)
+        self.renderer = SurfaceRenderer(self.screen)
+        # simulation setup
+        self.generation_rate = generation_rate
+        self.running = False
+        self.simulation = threading.Thread(target=self.simulate, daemon=True)
+        # held while the cells are used, so panning doesn't happen mid generation
+        self.cells_lock = threading.Lock()
+        # changes of the generations finished since the last frame, oldest first
+        self.changes_lock = threading.Lock()
+        self.changes = []
+        # nanoseconds the simulation spent on those generations
+        self.logic_ns = 0
+        self.detector = CycleDetector()
+        self.stop_on_cycle = stop_on_cycle
+        # with profile_path every frame is timed and written there on exit
+        self.profiler = FrameProfiler(PROFILED_SECTIONS, export_path=profile_path)
+        # screen rect the profiler overlay was last drawn over
+        self.overlay_rect = None
 
     def run(self) -> None:
         """Main loop of game.
 
-        Calls functions responsible for running game logic and drawing graphics every frame.
+        Starts the simulation thread, then handles input and draws the latest
+        generation every frame until the window is closed.
         """
-        while True:
-            self.process_game_logic()
+        self.running = True
+        self.simulation.start()
+        profiler = self.profiler
+        while self.running:
+            with profiler.section("input"):
+                self.handle_input()
             self.draw_game_elements()
+            with profiler.section("wait"):
+                self.clock.tick(FRAME_RATE)
+            profiler.end_frame()
+        self.simulation.join()
+        if hasattr(self.cells, "close"):
+            self.cells.close()
+        pygame.quit()
+
+    def simulate(self):
+        """Simulation thread, advances generations at generation_rate"""
+        next_generation = time.perf_counter()
+        while self.running:
+            self.process_game_logic()
+            if self.stop_on_cycle and self.detector.cycle is not None:
+                return
+            if self.generation_rate:
+                next_generation += 1 / self.generation_rate
+                delay = next_generation - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                else:
+                    # running behind, don't try to catch up later
+                    next_generation = time.perf_counter()
 
     def process_game_logic(self):
-        """Function for updating game logic every frame."""
-        self.cells.advance_generation()
+        """Function for updating game logic every generation."""
+        start = time.perf_counter_ns()
+        with self.cells_lock:
+            self.cells.advance_generation()
+            changes = self.cells.pop_changes()
+            self.queue_changes(changes, time.perf_counter_ns() - start)
+            # recorded under the lock, pan resets the detector under it
+            cycle = None
+            if self.detector.cycle is None:
+                cycle = self.detector.record(self.cells.generation, self.cells.board_hash)
+        if cycle is not None:
+            print(f"board repeats every {cycle[1]} generations from generation {cycle[0]}")
+
+    def queue_changes(self, changes, logic_ns=0):
+        """Add changes for the next frame to draw, and the nanoseconds it took
+        to make them, merging the queued changes into one once there are more
+        than MAX_QUEUED_CHANGES of them."""
+        with self.changes_lock:
+            self.changes.append(changes)
+            self.logic_ns += logic_ns
+            if len(self.changes) > MAX_QUEUED_CHANGES:
+                self.changes = [merge_changes(self.changes, self.cells.grid_len)]
 
     def draw_game_elements(self):
         """Method to draw to pygame screen every frame"""
-        updates = self.cells.draw_cells(self.screen)
-        pygame.display.update(updates)
+        with self.changes_lock:
+            changes, self.changes = self.changes, []
+            logic_ns, self.logic_ns = self.logic_ns, 0
+        profiler = self.profiler
+        profiler.add("logic", logic_ns)
+        updates = []
+        with profiler.section("draw"):
+            if self.overlay_rect is not None:
+                # draw the cells under the last overlay again
+                updates.append(self.renderer.redraw(self.overlay_rect))
+                self.overlay_rect = None
+            if changes:
+                updates += self.renderer.draw_changes(*merge_changes(changes, self.cells.grid_len))
+            self.overlay_rect = profiler.draw_overlay(self.screen)
+            if self.overlay_rect is not None:
+                updates.append(self.overlay_rect)
+        if not updates:
+            return
+        with profiler.section("display"):
+            pygame.display.update(updates)
 
     def handle_input(self):
-        pass
+        """Handle window events, stop the game when the window is closed or
+        escape or q is pressed"""
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                self.running = False
+            elif event.type == pygame.KEYDOWN and event.key in (pygame.K_ESCAPE, pygame.K_q):
+                self.running = False
+            elif event.type == pygame.KEYDOWN and event.key == pygame.K_F3:
+                self.profiler.toggle_overlay()
+
+        if hasattr(self.cells, "pan"):
+            keys = pygame.key.get_pressed()
+            dx = (keys[pygame.K_RIGHT] - keys[pygame.K_LEFT]) * PAN_STEP
+            dy = (keys[pygame.K_DOWN] - keys[pygame.K_UP]) * PAN_STEP
+            if dx or dy:
+                self.pan(dx, dy)
+
+    def pan(self, dx, dy):
+        """move the viewport of the cells dx cells right and dy cells down"""
+        with self.cells_lock:
+            self.cells.pan(dx, dy)
+            self.queue_changes(self.cells.pop_changes())
+            # the board hash of hashlife only covers the viewport
+            self.detector.reset()
 
 
 if __name__ == "__main__":
-    game = Game()
+    parser = argparse.ArgumentParser(description="Conway's Game of Life")
+    parser.add_argument("--backend", choices=BACKENDS, default="numpy")
+    parser.add_argument(
+        "--profile", metavar="PATH", help="time every frame and write the last frames to PATH (.csv or .json) on exit"
+    )
+    args = parser.parse_args()
+    game = Game(backend=args.backend, profile_path=args.profile)
     game.run()
@@ -0,0 +1,67 @@
+import numpy as np
+
+from config import SCREEN_SIZE, GRID_LEN
+from cycles import zobrist_hash
+from patterns import ArrayChangesMixin, PatternMixin, WrappingMixin
+
+
+# B3/S23 indexed by is_alive * 10 + living cells in the 3x3 block around a cell.
+# The block includes the cell itself, so a living cell survives on 3 or 4.
+RULE_TABLE = np.zeros(20, dtype=np.uint8)
+RULE_TABLE[3] = 1
+RULE_TABLE[10 + 3] = 1
+RULE_TABLE[10 + 4] = 1
+
+
+class NumpyCells(WrappingMixin, ArrayChangesMixin, PatternMixin):
+    """Collection of cells stored in a single NumPy array.
+
+    Does the same job as Cells but every generation is computed with whole
+    array operations instead of updating every Cell object one at a time.
+    The grid is indexed as grid[x, y] so locations match the ones used by Cells.
+    """
+    __slots__ = 'grid_len', 'grid', 'changing', 'pending', 'scale', 'generation', 'board_hash'
+
+    def __init__(self, grid_len: int = GRID_LEN, screen_size: int = SCREEN_SIZE):
+        """Make an empty grid of cells grid_len wide and high"""
+        self.grid_len = grid_len
+        self.grid = np.zeros((grid_len, grid_len), dtype=np.uint8)
+        # (x, y) locations of the cells that changed in the last generation
+        self.changing = np.empty((0, 2), dtype=np.intp)
+        # mask of the cells set alive that get revived next generation, see WrappingMixin
+        self.pending = None
+        self.scale = screen_size / grid_len
+        self.generation = 0
+        # Zobrist hash of the living cells, see cycles.py
+        self.board_hash = 0
+
+    def block_sums(self) -> np.ndarray:
+        """Count the living cells in the 3x3 block around every cell.
+
+        Rolling the array wraps around the edges, which makes the grid
+        toroidal the same way the neighbor calculation in Cell does.
+        """
+        grid = self.grid
+        columns = grid + np.roll(grid, 1, axis=1) + np.roll(grid, -1, axis=1)
+        return columns + np.roll(columns, 1, axis=0) + np.roll(columns, -1, axis=0)
+
+    def advance_generation(self):
+        """compute the next generation and remember which cells changed"""
+        self.generation += 1
+        index = self.block_sums()
+        index += self.grid * np.uint8(10)
+        new_grid = RULE_TABLE.take(index)
+        pending = self.take_pending()
+        if pending is not None:
+            new_grid[pending] = 1
+        self.changing = np.argwhere(new_grid != self.grid)
+        self.board_hash ^= zobrist_hash(self.changing)
+        self.grid = new_grid
+
+    def live_locations(self):
+        """return the locations of the living cells as an (n, 2) array"""
+        return np.argwhere(self.grid)
+
+    def alive_at(self, xs, ys):
+        """return whether the cells at xs, ys are alive as an array of 0 and 1"""
+        return self.grid[xs, ys]
@@ -0,0 +1,175 @@
+import numpy as np
+
+from config import SCREEN_SIZE, GRID_LEN
+from cycles import zobrist_hash
+from patterns import ArrayChangesMixin, PatternMixin, WrappingMixin, create_snapshot
+
+
+# rows advanced at a time, keeps the temporary arrays of a generation small
+BAND_ROWS = 256
+WORD_BITS = 64
+# little endian so the bytes of a word can be unpacked in cell order
+WORD = np.dtype('<u8')
+
+
+class PackedCells(WrappingMixin, ArrayChangesMixin, PatternMixin):
+    """Collection of cells stored as one bit per cell.
+
+    Each row of the grid is packed into 64 bit words, bit i of word w is the
+    cell at x = 64 * w + i. A generation adds up the neighbors of 64 cells at
+    once with bitwise adders, so a 10000x10000 grid only needs two 12.5 MB
+    buffers plus a band of temporaries. The grid is indexed as grid[y, word].
+    """
+    __slots__ = 'grid_len', 'grid', 'next_grid', 'last_mask', 'changing', 'pending_board', 'scale', 'generation', 'board_hash'
+
+    def __init__(self, grid_len: int = GRID_LEN, screen_size: int = SCREEN_SIZE):
+        """Make an empty grid of cells grid_len wide and high"""
+        self.grid_len = grid_len
+        words = -(-grid_len // WORD_BITS)
+        self.grid = np.zeros((grid_len, words), dtype=WORD)
+        self.next_grid = np.zeros_like(self.grid)
+        # bits of the last word of a row that are inside the grid
+        used_bits = grid_len - (words - 1) * WORD_BITS
+        self.last_mask = WORD.type((1 << used_bits) - 1)
+        # (x, y) locations of the cells that changed in the last generation
+        self.changing = np.empty((0, 2), dtype=np.intp)
+        # board of the cells set alive or restored from a snapshot that get
+        # revived next generation, laid out like the grid
+        self.pending_board = None
+        self.scale = screen_size / grid_len
+        self.generation = 0
+        # Zobrist hash of the living cells, see cycles.py
+        self.board_hash = 0
+
+    def set_alive_many(self, locations):
+        """set the cells at an (n, 2) array of locations as alive the next
+        time the generation advances, wrapping around like neighbors do"""
+        if self.pending_board is None or not self.pending_board.flags.writeable:
+            # a snapshot board is a read only memory map, so it is copied first
+            board = np.zeros_like(self.grid)
+            if self.pending_board is not None:
+                board |= self.pending_board
+            self.pending_board = board
+        xs = locations[:, 0] % self.grid_len
+        ys = locations[:, 1] % self.grid_len
+        np.bitwise_or.at(self.pending_board, (ys, xs // WORD_BITS), WORD.type(1) << (xs % WORD_BITS).astype(WORD))
+
+    def is_alive(self, x, y):
+        """return whether the cell at x, y is alive"""
+        return bool((int(self.grid[y, x // WORD_BITS]) >> (x % WORD_BITS)) & 1)
+
+    def shifted(self, rows):
+        """return rows moved so every bit holds its west and its east neighbor.
+        The ends of a row wrap around to each other."""
+        last_bit = WORD.type((self.grid_len - 1) % WORD_BITS)
+        one = WORD.type(1)
+        carry = WORD.type(WORD_BITS - 1)
+
+        west = rows << one
+        west[:, 1:] |= rows[:, :-1] >> carry
+        west[:, 0] |= (rows[:, -1] >> last_bit) & one
+        west[:, -1] &= self.last_mask
+
+        east = rows >> one
+        east[:, :-1] |= rows[:, 1:] << carry
+        east[:, -1] &= self.last_mask
+        east[:, -1] |= (rows[:, 0] & one) << last_bit
+        return west, east
+
+    def advance_generation(self):
+        """compute the next generation and remember which cells changed"""
+        self.generation += 1
+        grid_len = self.grid_len
+        grid = self.grid
+        new_grid = self.next_grid
+        for top in range(0, grid_len, BAND_ROWS):
+            bottom = min(top + BAND_ROWS, grid_len)
+            # the band plus the row above and below it, wrapping around
+            band = grid.take(np.arange(top - 1, bottom + 1), axis=0, mode='wrap')
+            west, east = self.shifted(band)
+
+            # two bit sum of west + center + east for every row of the band
+            row_0 = west ^ band ^ east
+            row_1 = (west & band) | (east & (west ^ band))
+            (above_0, above_1) = (row_0[:-2], row_1[:-2])
+            (below_0, below_1) = (row_0[2:], row_1[2:])
+            (west, east, center) = (west[1:-1], east[1:-1], band[1:-1])
+
+            # above + below, at most 6 so three bits
+            sum_0 = above_0 ^ below_0
+            carry = above_0 & below_0
+            sum_1 = above_1 ^ below_1 ^ carry
+            sum_2 = (above_1 & below_1) | (carry & (above_1 ^ below_1))
+
+            # + west + east, only whether the total is 2 or 3 matters so an 8
+            # wrapping around to 0 is fine
+            side_0 = west ^ east
+            side_1 = west & east
+            total_0 = sum_0 ^ side_0
+            carry = sum_0 & side_0
+            total_1 = sum_1 ^ side_1 ^ carry
+            carry = (sum_1 & side_1) | (carry & (sum_1 ^ side_1))
+            total_2 = sum_2 ^ carry
+
+            # alive on 3, or on 2 if already alive
+            result = new_grid[top:bottom]
+            np.bitwise_or(total_0, center, out=result)
+            result &= total_1
+            result &= ~total_2
+            result[:, -1] &= self.last_mask
+
+        if self.pending_board is not None:
+            new_grid |= self.pending_board
+            self.pending_board = None
+
+        changing = []
+        for top in range(0, grid_len, BAND_ROWS):
+            diff = grid[top:top + BAND_ROWS] ^ new_grid[top:top + BAND_ROWS]
+            changing.append(self.bit_locations(diff, top))
+        self.changing = np.concatenate(changing)
+        self.board_hash ^= zobrist_hash(self.changing)
+        self.grid, self.next_grid = new_grid, grid
+
+    def restore_snapshot(self, size, origin, generation, board):
+        """revive the living cells of a snapshot board next generation.
+        A board of the whole grid has the same layout as the grid, so it is
+        used as is, any other is set alive a band of rows at a time."""
+        if tuple(size) != (self.grid_len, self.grid_len) or tuple(origin) != (0, 0):
+            super().restore_snapshot(size, origin, generation, board)
+            return
+        if self.pending_board is None:
+            self.pending_board = board
+        else:
+            self.pending_board = self.pending_board | board
+        self.generation = generation - 1
+
+    def save_snapshot(self, path):
+        """save the living cells and the generation counter to a snapshot file.
+        Cells set alive that haven't been revived yet are not saved."""
+        board = create_snapshot(path, (self.grid_len, self.grid_len), (0, 0), self.generation)
+        board[:] = self.grid
+        board.flush()
+
+    @staticmethod
+    def bit_locations(rows, top):
+        """return the (x, y) locations of the set bits of rows, a band of rows
+        starting at row top"""
+        ys, words = np.nonzero(rows)
+        bits = np.unpackbits(
+            rows[ys, words].view(np.uint8).reshape(-1, 8), axis=1, bitorder='little'
+        )
+        index, bit = np.nonzero(bits)
+        return np.column_stack((words[index] * WORD_BITS + bit, ys[index] + top))
+
+    def live_locations(self):
+        """return the locations of the living cells as an (n, 2) array"""
+        return np.concatenate([
+            self.bit_locations(self.grid[top:top + BAND_ROWS], top)
+            for top in range(0, self.grid_len, BAND_ROWS)
+        ])
+
+    def alive_at(self, xs, ys):
+        """return whether the cells at xs, ys are alive as an array of 0 and 1"""
+        words = self.grid[ys, xs // WORD_BITS]
+        alive = (words >> (xs % WORD_BITS).astype(WORD)) & WORD.type(1)
+        return alive.astype(np.uint8)
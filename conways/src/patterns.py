@@ -0,0 +1,337 @@
+"""Loading patterns from presets and pattern files, and saving and restoring
+whole boards as snapshots.
+
+Supported pattern files are run length encoded `.rle` files and plaintext
+`.cells` files, see https://conwaylife.com/wiki/Run_Length_Encoded and
+https://conwaylife.com/wiki/Plaintext. Both are read a line at a time so a
+large pattern never has to be held in memory as a list of locations.
+
+A snapshot is a header followed by the board, one bit per cell, row by row.
+Every row is padded to a whole number of 64 bit words so the file can be
+memory mapped and used as is by PackedCells. The header holds the size of the
+board and the universe location of its top left cell: backends with a fixed
+grid save the whole grid at (0, 0), unbounded ones the bounding box of their
+living cells.
+"""
+import struct
+from itertools import chain, islice
+from pathlib import Path
+
+import numpy as np
+import pygame
+
+from presets import PRESETS
+
+
+SNAPSHOT_MAGIC = b"LIFESNAP"
+SNAPSHOT_VERSION = 1
+# magic, version, width, height, generation, left, top, padding to 56 bytes
+SNAPSHOT_HEADER = struct.Struct("<8sIQQQqq4x")
+# rows of a snapshot unpacked at a time when restoring into a backend
+SNAPSHOT_BAND_ROWS = 256
+# locations of a pattern file handed to set_alive_many at a time
+PATTERN_BATCH = 16384
+
+
+def read_rle(path):
+    """Yield the (x, y) location of every living cell of an .rle file"""
+    x = y = 0
+    with open(path) as file:
+        for line in file:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("x"):
+                check_rule(line)
+                continue
+            count = ""
+            for char in line:
+                if char.isdigit():
+                    count += char
+                    continue
+                run = int(count) if count else 1
+                count = ""
+                if char == "b":
+                    x += run
+                elif char == "$":
+                    x = 0
+                    y += run
+                elif char == "!":
+                    return
+                else:
+                    # o, or any other state of a multi state pattern
+                    for _ in range(run):
+                        yield (x, y)
+                        x += 1
+
+
+def check_rule(header):
+    """raise ValueError if an .rle header line asks for a rule other than B3/S23"""
+    for field in header.split(","):
+        name, _, value = field.partition("=")
+        if name.strip() == "rule" and value.strip().upper() not in ("B3/S23", "23/3"):
+            raise ValueError(f"unsupported rule {value.strip()}")
+
+
+def read_plaintext(path):
+    """Yield the (x, y) location of every living cell of a plaintext .cells file"""
+    with open(path) as file:
+        y = 0
+        for line in file:
+            if line.startswith("!"):
+                continue
+            for x, char in enumerate(line.rstrip("\n")):
+                if char in "O*":
+                    yield (x, y)
+            y += 1
+
+
+def location_batches(locations, size=PATTERN_BATCH):
+    """Yield the (x, y) tuples of an iterable as (n, 2) arrays of at most size
+    locations, so only one batch is ever held at a time"""
+    locations = iter(locations)
+    while True:
+        batch = np.fromiter(chain.from_iterable(islice(locations, size)), dtype=np.intp)
+        if len(batch) == 0:
+            return
+        yield batch.reshape(-1, 2)
+
+
+def pattern_locations(key):
+    """Yield the locations of a preset key or of a pattern file.
+    Raises KeyError when key is neither."""
+    if key in PRESETS:
+        yield from PRESETS[key]
+        return
+    path = Path(key)
+    if path.suffix == ".rle":
+        yield from read_rle(path)
+    elif path.suffix == ".cells":
+        yield from read_plaintext(path)
+    else:
+        raise KeyError(key)
+
+
+def is_snapshot(key):
+    """return whether key is the path of a snapshot file"""
+    path = Path(key)
+    if key in PRESETS or not path.is_file():
+        return False
+    with open(path, "rb") as file:
+        return file.read(len(SNAPSHOT_MAGIC)) == SNAPSHOT_MAGIC
+
+
+def row_words(width):
+    """number of 64 bit words a row of a snapshot takes"""
+    return -(-width // 64)
+
+
+def create_snapshot(path, size, origin, generation):
+    """Make an empty snapshot file of a (width, height) board whose top left
+    cell is at origin and return the board memory mapped as (height, words)
+    little endian 64 bit words, bit x % 64 of word x // 64 being the cell at
+    origin x + x"""
+    (width, height) = size
+    (left, top) = origin
+    with open(path, "wb") as file:
+        file.write(SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, SNAPSHOT_VERSION, width, height, generation, left, top))
+    return np.memmap(
+        path, dtype="<u8", mode="r+", offset=SNAPSHOT_HEADER.size, shape=(height, row_words(width))
+    )
+
+
+def open_snapshot(path):
+    """return (size, origin, generation, board) of a snapshot file, the
+    board memory mapped read only the same way as create_snapshot"""
+    with open(path, "rb") as file:
+        magic, version, width, height, generation, left, top = SNAPSHOT_HEADER.unpack(
+            file.read(SNAPSHOT_HEADER.size)
+        )
+    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+        raise ValueError(f"{path} is not a version {SNAPSHOT_VERSION} snapshot")
+    board = np.memmap(
+        path, dtype="<u8", mode="r", offset=SNAPSHOT_HEADER.size, shape=(height, row_words(width))
+    )
+    return (width, height), (left, top), generation, board
+
+
+def board_locations(board, top, bottom):
+    """return the (x, y) locations of the living cells in rows top to
+    bottom - 1 of a snapshot board as an (n, 2) array"""
+    bits = np.unpackbits(np.ascontiguousarray(board[top:bottom]).view(np.uint8), axis=1, bitorder="little")
+    ys, xs = np.nonzero(bits)
+    return np.column_stack((xs, ys + top))
+
+
+class PatternMixin:
+    """Gives a collection of cells load_preset and save_snapshot.
+
+    The collection needs set_alive, a generation counter, a grid_len and
+    live_locations returning the locations of its living cells. Patterns and
+    snapshots are handed to set_alive_many a batch of locations at a time,
+    backends that keep their cells in arrays set them all at once.
+
+    Backends with a universe larger than their grid set unbounded and give
+    universe_locations, so snapshots hold every living cell instead of the
+    ones in the viewport.
+    """
+    __slots__ = ()
+    # whether living cells can be anywhere instead of only inside the grid
+    unbounded = False
+
+    def load_preset(self, key, offsetx=0, offsety=0):
+        """load a preset, a pattern file or a snapshot.
+
+        Like set_alive the cells show up the next time the generation advances.
+        A snapshot replaces the generation counter and is not moved by the offsets.
+        """
+        try:
+            if is_snapshot(key):
+                self.restore_snapshot(*open_snapshot(key))
+                return
+            for locations in location_batches(pattern_locations(key)):
+                locations += (offsetx, offsety)
+                self.set_alive_many(locations)
+        except KeyError:
+            print("KEYERROR: ", key)  # maybe display error over game
+        except (OSError, ValueError) as error:
+            print("could not load", key, error)
+
+    def restore_snapshot(self, size, origin, generation, board):
+        """set the living cells of a snapshot board alive at their universe
+        locations, a band of rows at a time"""
+        (width, height) = size
+        (left, top) = origin
+        if not self.unbounded and (
+            left < 0 or top < 0 or left + width > self.grid_len or top + height > self.grid_len
+        ):
+            raise ValueError(
+                f"snapshot of {width}x{height} cells at {origin} does not fit the {self.grid_len} wide grid"
+            )
+        for band in range(0, height, SNAPSHOT_BAND_ROWS):
+            locations = board_locations(board, band, band + SNAPSHOT_BAND_ROWS)
+            locations += origin
+            self.set_alive_many(locations)
+        # advancing the generation revives the cells
+        self.generation = generation - 1
+
+    def set_alive_many(self, locations):
+        """set the cells at an (n, 2) array of locations as alive the next time
+        the generation advances. Backends that keep every cell as a Python
+        object anyway set them one at a time with set_alive."""
+        for (x, y) in locations.tolist():
+            self.set_alive((x, y))
+
+    def save_snapshot(self, path):
+        """save the living cells and the generation counter to a snapshot file,
+        the whole grid or, for unbounded backends, the bounding box of every
+        living cell. Cells set alive that haven't been revived yet are not saved."""
+        if self.unbounded:
+            locations = self.universe_locations()
+            if len(locations):
+                origin = locations.min(axis=0)
+                size = locations.max(axis=0) + 1 - origin
+            else:
+                (origin, size) = (np.zeros(2, dtype=np.intp), np.ones(2, dtype=np.intp))
+            board = create_snapshot(path, size.tolist(), origin.tolist(), self.generation)
+            locations = locations - origin
+        else:
+            board = create_snapshot(path, (self.grid_len, self.grid_len), (0, 0), self.generation)
+            locations = self.live_locations()
+        (xs, ys) = (locations[:, 0], locations[:, 1])
+        bytes_per_row = board.shape[1] * 8
+        np.bitwise_or.at(
+            board.reshape(-1).view(np.uint8),
+            ys * bytes_per_row + xs // 8,
+            (1 << (xs % 8)).astype(np.uint8),
+        )
+        board.flush()
+
+
+class WrappingMixin:
+    """Gives a collection of cells on a toroidal grid set_alive and set_alive_many.
+
+    Locations outside the grid wrap around like neighbors do. By default the
+    cells waiting to be revived are kept in pending, a grid_len x grid_len
+    boolean mask indexed as pending[x, y] that is only made once a cell is
+    set, which costs no more than the grid of a backend that keeps one.
+    Backends that store their cells differently override set_alive_many.
+    """
+    __slots__ = ()
+
+    def set_alive(self, loc):
+        """set cell as alive the next time the generation advances"""
+        self.set_alive_many(np.array([loc], dtype=np.intp))
+
+    def set_alive_many(self, locations):
+        """set the cells at an (n, 2) array of locations as alive the next
+        time the generation advances"""
+        if self.pending is None:
+            self.pending = np.zeros((self.grid_len, self.grid_len), dtype=bool)
+        self.pending[locations[:, 0] % self.grid_len, locations[:, 1] % self.grid_len] = True
+
+    def take_pending(self):
+        """return the mask of the cells waiting to be revived, or None when
+        there are none, and forget them"""
+        pending = self.pending
+        self.pending = None
+        return pending
+
+
+class ArrayChangesMixin:
+    """Gives a collection of cells pop_changes and draw_cells.
+
+    The collection keeps the locations of the cells that changed in the last
+    generation in changing as an (n, 2) array, and needs alive_at returning
+    whether the cells at arrays of xs and ys are alive now.
+    """
+    __slots__ = ()
+
+    def pop_changes(self):
+        """return the locations of the cells that changed as an (n, 2) array
+        and whether each of them is alive now, then forget the changes"""
+        locations = self.changing
+        self.changing = self.changing[:0]
+        return locations, self.alive_at(locations[:, 0], locations[:, 1])
+
+    def draw_cells(self, screen):
+        """Draw changing cells"""
+        (locations, alive) = self.pop_changes()
+        updates = []
+        scale = self.scale
+        for (x, y), is_alive in zip(locations.tolist(), alive.tolist()):
+            color = 0xffffff if is_alive else 0x000000
+            rect = pygame.Rect(x * scale, y * scale, scale, scale)
+            pygame.draw.rect(screen, color, rect)
+            updates.append(rect)
+        return updates
+
+
+class ListChangesMixin:
+    """Gives a collection of cells pop_changes and draw_cells.
+
+    The collection keeps the cells that changed in changing as a list of
+    (location, is_alive).
+    """
+    __slots__ = ()
+
+    def pop_changes(self):
+        """return the locations of the cells that changed as an (n, 2) array
+        and whether each of them is alive now, then forget the changes"""
+        changing = self.changing
+        self.changing = []
+        locations = np.array([loc for loc, _ in changing], dtype=np.intp).reshape(-1, 2)
+        alive = np.array([is_alive for _, is_alive in changing], dtype=np.uint8)
+        return locations, alive
+
+    def draw_cells(self, screen):
+        """Draw changing cells"""
+        updates = []
+        scale = self.scale
+        for (x, y), is_alive in self.changing:
+            color = 0xffffff if is_alive else 0x000000
+            rect = pygame.Rect(x * scale, y * scale, scale, scale)
+            pygame.draw.rect(screen, color, rect)
+            updates.append(rect)
+        self.changing = []
+        return updates
@@ -0,0 +1,135 @@
+import numpy as np
+import pygame
+
+from config import SCREEN_SIZE, GRID_LEN
+
+
+# cells are grouped into square blocks of this many cells when merging the
+# changed cells into dirty rectangles
+BLOCK_LEN = 16
+# redraw the whole frame once more than this share of the cells changed,
+# or when the changes can't be covered by a few rectangles
+FULL_FRAME_FRACTION = 0.02
+MAX_DIRTY_RECTS = 32
+
+
+def merge_changes(changes, grid_len):
+    """Merge a list of (locations, alive) changes of several generations,
+    oldest first, into one keeping the latest state of every cell"""
+    if len(changes) == 1:
+        return changes[0]
+    locations = np.concatenate([locations for locations, _ in changes])
+    alive = np.concatenate([alive for _, alive in changes])
+    # the first occurrence of a cell in the reversed changes is its latest state
+    keys = locations[::-1, 0] * grid_len + locations[::-1, 1]
+    _, latest = np.unique(keys, return_index=True)
+    return locations[::-1][latest], alive[::-1][latest]
+
+
+class SurfaceRenderer:
+    """Draws cells by writing their state straight into a pixel buffer.
+
+    Every cell is one pixel of an 8 bit surface with a black and white palette.
+    The changes of a generation are written into it with surfarray and the
+    surface is scaled up to the screen, either the whole frame at once or only
+    a few rectangles around the changed cells, whichever is cheaper.
+    """
+    __slots__ = 'screen', 'grid_len', 'scale', 'cells_surface', 'scaled', 'full_frame'
+
+    def __init__(self, screen, grid_len: int = GRID_LEN, screen_size: int = SCREEN_SIZE):
+        self.screen = screen
+        self.grid_len = grid_len
+        self.scale = screen_size / grid_len
+        self.cells_surface = pygame.Surface((grid_len, grid_len), depth=8)
+        self.cells_surface.set_palette([(0, 0, 0), (255, 255, 255)])
+        self.cells_surface.fill(0)
+        self.scaled = pygame.Surface((screen_size, screen_size), depth=8)
+        self.scaled.set_palette([(0, 0, 0), (255, 255, 255)])
+        # whether the last frame was drawn as a whole
+        self.full_frame = False
+
+    def draw(self, cells):
+        """Draw the cells that changed since the last draw and return the
+        rects of the screen that have to be updated"""
+        return self.draw_changes(*cells.pop_changes())
+
+    def draw_changes(self, locations, alive):
+        """Draw changes as returned by pop_changes and return the rects of
+        the screen that have to be updated"""
+        if len(locations) == 0:
+            return []
+        xs = locations[:, 0]
+        ys = locations[:, 1]
+        pixels = pygame.surfarray.pixels2d(self.cells_surface)
+        pixels[xs, ys] = alive
+        del pixels  # unlocks the surface
+
+        rects = None
+        if len(locations) <= FULL_FRAME_FRACTION * self.grid_len * self.grid_len:
+            rects = self.dirty_rects(xs, ys)
+            if len(rects) > MAX_DIRTY_RECTS:
+                rects = None
+        self.full_frame = rects is None
+        if self.full_frame:
+            pygame.transform.scale(self.cells_surface, self.scaled.get_size(), self.scaled)
+            self.screen.blit(self.scaled, (0, 0))
+            return [self.screen.get_rect()]
+        return [self.draw_rect(rect) for rect in rects]
+
+    def dirty_rects(self, xs, ys):
+        """Merge the changed cells into a few rects of whole blocks, in cells"""
+        blocks_len = -(-self.grid_len // BLOCK_LEN)
+        blocks = np.zeros((blocks_len, blocks_len), dtype=bool)
+        blocks[xs // BLOCK_LEN, ys // BLOCK_LEN] = True
+
+        # runs of dirty blocks in every row of blocks, merged with the run
+        # right above them when they span exactly the same columns
+        rects = []
+        open_runs = {}
+        previous_by = -2
+        for by in np.flatnonzero(blocks.any(axis=0)).tolist():
+            if by != previous_by + 1:
+                open_runs = {}
+            previous_by = by
+            runs = {}
+            for start, end in self.runs(blocks[:, by]):
+                rect = open_runs.get((start, end))
+                if rect is None:
+                    rect = [start, by, end - start, 1]
+                    rects.append(rect)
+                else:
+                    rect[3] += 1
+                runs[(start, end)] = rect
+            open_runs = runs
+
+        grid_len = self.grid_len
+        return [
+            pygame.Rect(x * BLOCK_LEN, y * BLOCK_LEN, w * BLOCK_LEN, h * BLOCK_LEN).clip(0, 0, grid_len, grid_len)
+            for x, y, w, h in rects
+        ]
+
+    @staticmethod
+    def runs(row):
+        """return (start, end) of every run of True values in row"""
+        edges = np.flatnonzero(np.diff(np.concatenate(([False], row, [False])).astype(np.int8)))
+        return zip(edges[::2].tolist(), edges[1::2].tolist())
+
+    def redraw(self, screen_rect):
+        """Scale the cells under a rect of the screen onto it again and
+        return the screen rect that was drawn"""
+        scale = self.scale
+        left = int(screen_rect.left // scale)
+        top = int(screen_rect.top // scale)
+        right = min(self.grid_len, int(-(-screen_rect.right // scale)))
+        bottom = min(self.grid_len, int(-(-screen_rect.bottom // scale)))
+        return self.draw_rect(pygame.Rect(left, top, right - left, bottom - top))
+
+    def draw_rect(self, rect):
+        """Scale one rect of cells onto the screen and return the screen rect"""
+        scale = self.scale
+        left = round(rect.left * scale)
+        top = round(rect.top * scale)
+        dest = pygame.Rect(left, top, round(rect.right * scale) - left, round(rect.bottom * scale) - top)
+        area = pygame.transform.scale(self.cells_surface.subsurface(rect), dest.size)
+        self.screen.blit(area, dest)
+        return dest
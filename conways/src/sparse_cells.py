@@ -0,0 +1,111 @@
+import numpy as np
+
+from config import SCREEN_SIZE, GRID_LEN
+from cycles import zobrist_key
+from patterns import ListChangesMixin, PatternMixin, WrappingMixin
+
+
+# offsets from a cell to its 8 neighbors
+NEIGHBOR_OFFSETS = [
+    (-1, -1), (0, -1), (1, -1),
+    (-1, 0), (1, 0),
+    (-1, 1), (0, 1), (1, 1),
+]
+
+
+class SparseCells(WrappingMixin, ListChangesMixin, PatternMixin):
+    """Collection of cells that only stores and checks the interesting ones.
+
+    Only living cells and the living neighbor counts of cells next to them are
+    kept, so memory grows with the population instead of with the grid.
+    A cell can only change if one of its neighbors (or itself) changed in the
+    previous generation, so each generation only the cells around the last
+    changes are checked against the rules.
+    """
+    __slots__ = 'grid_len', 'alive', 'living_neighbors', 'active', 'changing', 'pending', 'scale', 'generation', 'board_hash'
+
+    def __init__(self, grid_len: int = GRID_LEN, screen_size: int = SCREEN_SIZE):
+        """Make an empty toroidal grid of cells grid_len wide and high"""
+        self.grid_len = grid_len
+        self.alive = set()
+        # living neighbor count of every cell that has at least one
+        self.living_neighbors = {}
+        # cells that could change in the next generation
+        self.active = set()
+        # (location, is_alive) of the cells that changed in the last generation
+        self.changing = []
+        # locations set alive with set_alive that get revived next generation
+        self.pending = []
+        self.scale = screen_size / grid_len
+        self.generation = 0
+        # Zobrist hash of the living cells, see cycles.py
+        self.board_hash = 0
+
+    def set_alive_many(self, locations):
+        """set the cells at an (n, 2) array of locations as alive the next
+        time the generation advances, wrapping around like neighbors do"""
+        self.pending.extend(map(tuple, (locations % self.grid_len).tolist()))
+
+    def neighbors(self, loc):
+        """locations of the 8 neighbors of loc, wrapping around the edges"""
+        (x, y) = loc
+        n = self.grid_len
+        return [((x + dx) % n, (y + dy) % n) for dx, dy in NEIGHBOR_OFFSETS]
+
+    def advance_generation(self):
+        """check the active cells against the rules and apply the changes"""
+        self.generation += 1
+        alive = self.alive
+        living_neighbors = self.living_neighbors
+        changes = []
+        for loc in self.active:
+            count = living_neighbors.get(loc, 0)
+            if loc in alive:
+                if count < 2 or count > 3:
+                    changes.append((loc, False))
+            elif count == 3:
+                changes.append((loc, True))
+        for loc in self.pending:
+            if loc not in alive:
+                changes.append((loc, True))
+        self.pending.clear()
+
+        self.changing = []
+        self.active = set()
+        for loc, is_alive in changes:
+            if is_alive:
+                self.revive(loc)
+            else:
+                self.kill(loc)
+
+    def kill(self, loc):
+        """kill cell and decrement living neighbor count of neighbors"""
+        if loc in self.alive:
+            self.alive.remove(loc)
+            self.board_hash ^= zobrist_key(loc)
+            living_neighbors = self.living_neighbors
+            for neighbor in self.neighbors(loc):
+                count = living_neighbors[neighbor] - 1
+                if count > 0:
+                    living_neighbors[neighbor] = count
+                else:
+                    del living_neighbors[neighbor]
+                self.active.add(neighbor)
+            self.active.add(loc)
+            self.changing.append((loc, False))
+
+    def revive(self, loc):
+        """revive cell and increment living neighbor count of neighbors"""
+        if loc not in self.alive:
+            self.alive.add(loc)
+            self.board_hash ^= zobrist_key(loc)
+            living_neighbors = self.living_neighbors
+            for neighbor in self.neighbors(loc):
+                living_neighbors[neighbor] = living_neighbors.get(neighbor, 0) + 1
+                self.active.add(neighbor)
+            self.active.add(loc)
+            self.changing.append((loc, True))
+
+    def live_locations(self):
+        """return the locations of the living cells as an (n, 2) array"""
+        return np.array(list(self.alive), dtype=np.intp).reshape(-1, 2)
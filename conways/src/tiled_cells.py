@@ -0,0 +1,162 @@
+import argparse
+import os
+import weakref
+from multiprocessing import Pool, shared_memory
+
+import numpy as np
+
+from config import SCREEN_SIZE, GRID_LEN
+from numpy_cells import NumpyCells, RULE_TABLE
+from cycles import zobrist_hash
+from patterns import ArrayChangesMixin, PatternMixin, WrappingMixin
+from presets import PRESETS
+
+
+# views of the shared grids inside a worker process, set up by attach_worker
+worker_grids = []
+
+
+def attach_worker(names, grid_len):
+    """Pool initializer, map the two shared grids into the worker process"""
+    for name in names:
+        memory = shared_memory.SharedMemory(name=name)
+        worker_grids.append((memory, np.ndarray((grid_len, grid_len), dtype=np.uint8, buffer=memory.buf)))
+
+
+def step_tile(args):
+    """Advance rows left to right - 1 of the grid in source into the other grid.
+
+    Only the rows of the tile and one halo row on each side are read. Returns
+    the (x, y) locations of the cells of the tile that changed.
+    """
+    (source, left, right) = args
+    grid = worker_grids[source][1]
+    new_grid = worker_grids[1 - source][1]
+    # the tile plus the halo rows, wrapping around the edges of the grid
+    tile = grid.take(np.arange(left - 1, right + 1), axis=0, mode='wrap')
+    columns = tile + np.roll(tile, 1, axis=1) + np.roll(tile, -1, axis=1)
+    index = columns[:-2] + columns[1:-1] + columns[2:]
+    index += tile[1:-1] * np.uint8(10)
+    result = RULE_TABLE.take(index)
+    new_grid[left:right] = result
+    changed = np.argwhere(result != tile[1:-1])
+    changed[:, 0] += left
+    return changed
+
+
+class TiledCells(WrappingMixin, ArrayChangesMixin, PatternMixin):
+    """Collection of cells advanced by a pool of worker processes.
+
+    The grid is indexed as grid[x, y] like NumpyCells and is kept twice in
+    shared memory, the current generation and the one being computed. It is
+    split into tiles of whole rows and every worker advances one tile reading
+    its rows plus one row of its neighbors on each side, so the grid wraps
+    around across tile borders the same way it does on a single core.
+    """
+    __slots__ = 'grid_len', 'memory', 'grids', 'current', 'tiles', 'pool', 'finalizer', 'changing', 'pending', 'scale', 'generation', 'board_hash', '__weakref__'
+
+    def __init__(self, grid_len: int = GRID_LEN, screen_size: int = SCREEN_SIZE, workers: int | None = None):
+        """Make an empty grid of cells grid_len wide and high advanced by
+        workers processes, one for every cpu by default"""
+        workers = workers or os.cpu_count()
+        self.grid_len = grid_len
+        self.memory = [shared_memory.SharedMemory(create=True, size=grid_len * grid_len) for _ in range(2)]
+        self.grids = [np.ndarray((grid_len, grid_len), dtype=np.uint8, buffer=m.buf) for m in self.memory]
+        for grid in self.grids:
+            grid.fill(0)
+        # index of the grid holding the current generation
+        self.current = 0
+        bounds = np.linspace(0, grid_len, min(workers, grid_len) + 1).astype(int)
+        self.tiles = list(zip(bounds[:-1].tolist(), bounds[1:].tolist()))
+        self.pool = Pool(workers, attach_worker, ([m.name for m in self.memory], grid_len))
+        self.finalizer = weakref.finalize(self, TiledCells.release, self.pool, self.memory)
+        # (x, y) locations of the cells that changed in the last generation
+        self.changing = np.empty((0, 2), dtype=np.intp)
+        # mask of the cells set alive that get revived next generation, see WrappingMixin
+        self.pending = None
+        self.scale = screen_size / grid_len
+        self.generation = 0
+        # Zobrist hash of the living cells, see cycles.py
+        self.board_hash = 0
+
+    @property
+    def grid(self):
+        """the current generation"""
+        return self.grids[self.current]
+
+    @staticmethod
+    def release(pool, memory):
+        """stop the workers and free the shared grids"""
+        pool.terminate()
+        pool.join()
+        for m in memory:
+            m.close()
+            m.unlink()
+
+    def close(self):
+        """stop the workers and free the shared grids, the cells can't be
+        advanced after this"""
+        self.finalizer()
+
+    def advance_generation(self):
+        """have the workers compute the next generation, then remember which
+        cells changed"""
+        self.generation += 1
+        tasks = [(self.current, left, right) for left, right in self.tiles]
+        changing = self.pool.map(step_tile, tasks)
+        old_grid = self.grid
+        self.current = 1 - self.current
+        pending = self.take_pending()
+        if pending is not None:
+            self.grid[pending] = 1
+            # revived cells may not be in the lists from the workers, and cells
+            # the workers killed may be alive again
+            changing.append(np.argwhere(pending))
+            changing = np.unique(np.concatenate(changing), axis=0)
+            (xs, ys) = (changing[:, 0], changing[:, 1])
+            self.changing = changing[self.grid[xs, ys] != old_grid[xs, ys]]
+        else:
+            self.changing = np.concatenate(changing)
+        self.board_hash ^= zobrist_hash(self.changing)
+
+    def live_locations(self):
+        """return the locations of the living cells as an (n, 2) array"""
+        return np.argwhere(self.grid)
+
+    def alive_at(self, xs, ys):
+        """return whether the cells at xs, ys are alive as an array of 0 and 1"""
+        return self.grid[xs, ys]
+
+
+def verify(key, offsetx=0, offsety=0, generations=100, grid_len=GRID_LEN, workers=None):
+    """Run a preset on TiledCells and NumpyCells side by side and return the
+    first generation where the grids differ, or None if they are identical"""
+    single = NumpyCells(grid_len)
+    tiled = TiledCells(grid_len, workers=workers)
+    try:
+        single.load_preset(key, offsetx, offsety)
+        tiled.load_preset(key, offsetx, offsety)
+        for generation in range(1, generations + 1):
+            single.advance_generation()
+            tiled.advance_generation()
+            if not np.array_equal(single.grid, tiled.grid):
+                return generation
+        return None
+    finally:
+        tiled.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that TiledCells matches the single core NumpyCells")
+    parser.add_argument("preset", choices=PRESETS)
+    parser.add_argument("--generations", type=int, default=100)
+    parser.add_argument("--grid-len", type=int, default=GRID_LEN)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--offset", type=int, default=0)
+    args = parser.parse_args()
+    mismatch = verify(args.preset, args.offset, args.offset, args.generations, args.grid_len, args.workers)
+    if mismatch is None:
+        print(f"identical for {args.generations} generations")
+    else:
+        print(f"grids differ at generation {mismatch}")
+        raise SystemExit(1)
@@ -0,0 +1,228 @@
+"""Measuring where the time of a frame goes, shared by all the games.
+
+A FrameProfiler times labelled sections of every frame with
+time.perf_counter_ns and keeps the last FRAMES_KEPT frames in a ring buffer
+that is allocated once, so profiling doesn't make garbage every frame. It can
+show the rolling average and 99th percentile of every section in an overlay
+and write the frames it kept to a CSV or JSON file when the game exits. When
+it is turned off timing a section does nothing.
+
+Usage:
+    profiler = FrameProfiler(("input", "logic", "draw"))
+    with profiler.section("input"):
+        ...
+    profiler.end_frame()
+"""
+import atexit
+import json
+from array import array
+from pathlib import Path
+from time import perf_counter_ns
+
+import pygame
+
+# frames the ring buffer remembers
+FRAMES_KEPT = 240
+# frames between updates of the overlay text
+OVERLAY_REFRESH = 30
+OVERLAY_FONT_SIZE = 20
+OVERLAY_COLOR = (0, 255, 0)
+OVERLAY_BACKGROUND = (0, 0, 0, 180)
+
+
+def percentile(sorted_values, fraction):
+    """return the value at fraction (0 to 1) of an already sorted list"""
+    index = min(len(sorted_values) - 1, int(fraction * len(sorted_values)))
+    return sorted_values[index]
+
+
+class Section:
+    """Context manager adding the time spent inside it to one column of the
+    current frame. Made once per label, so timing allocates nothing."""
+
+    __slots__ = 'profiler', 'column', 'start'
+
+    def __init__(self, profiler, column):
+        self.profiler = profiler
+        self.column = column
+        self.start = 0
+
+    def __enter__(self):
+        self.start = perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        profiler = self.profiler
+        profiler.times[profiler.row + self.column] += perf_counter_ns() - self.start
+        return False
+
+
+class NullSection:
+    """Section that does nothing, used while profiling is off."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+NULL_SECTION = NullSection()
+
+
+class FrameProfiler:
+    """Times labelled sections of every frame.
+
+    The ring buffer holds a row of nanoseconds per frame, one column per
+    label plus a last "total" column with the time of the whole frame, measured from
+    one end_frame to the next. A section timed more than once in a frame adds
+    up. With export_path the kept frames are exported when the program exits.
+    """
+
+    __slots__ = (
+        'labels', 'sections', 'columns', 'frames', 'times', 'frame', 'row', 'frame_start',
+        'enabled', 'was_enabled', 'overlay', 'font', 'overlay_surface', 'export_path',
+    )
+
+    def __init__(self, labels, frames: int = FRAMES_KEPT, enabled: bool = False, export_path: str | None = None):
+        """Make a profiler of the sections in labels, remembering 'frames' frames"""
+        self.labels = tuple(labels)
+        self.columns = len(self.labels) + 1
+        self.sections = {label: Section(self, column) for column, label in enumerate(self.labels)}
+        self.frames = frames
+        self.times = array('q', bytes(8 * frames * self.columns))
+        # frames ended so far, and where the row of the current one starts in times
+        self.frame = 0
+        self.row = 0
+        self.frame_start = perf_counter_ns()
+        self.enabled = enabled or export_path is not None
+        # whether profiling was on before the overlay was shown, it goes back to that when hidden
+        self.was_enabled = self.enabled
+        self.overlay = False
+        # made the first time the overlay is shown
+        self.font = None
+        self.overlay_surface = None
+        self.export_path = export_path
+        if export_path is not None:
+            atexit.register(self.export, export_path)
+
+    def section(self, label: str):
+        """return a context manager that times the section label"""
+        if not self.enabled:
+            return NULL_SECTION
+        return self.sections[label]
+
+    def add(self, label: str, nanoseconds: int):
+        """add time measured some other way, like on another thread, to the
+        section label of the current frame"""
+        if self.enabled:
+            self.times[self.row + self.sections[label].column] += nanoseconds
+
+    def end_frame(self):
+        """finish the current frame and start the next one"""
+        if not self.enabled:
+            return
+        now = perf_counter_ns()
+        times = self.times
+        columns = self.columns
+        times[self.row + columns - 1] = now - self.frame_start
+        self.frame_start = now
+        self.frame += 1
+        self.row = (self.frame % self.frames) * columns
+        for i in range(self.row, self.row + columns):
+            times[i] = 0
+        if self.overlay and self.frame % OVERLAY_REFRESH == 0:
+            self.overlay_surface = None
+
+    def kept_rows(self):
+        """return the rows of the finished frames still in the ring buffer, oldest first"""
+        count = min(self.frame, self.frames)
+        columns = self.columns
+        times = self.times
+        rows = []
+        for frame in range(self.frame - count, self.frame):
+            row = (frame % self.frames) * columns
+            rows.append(times[row:row + columns])
+        return rows
+
+    def stats(self):
+        """return the mean and 99th percentile in ms of every section and of
+        the whole frame ("total") over the kept frames"""
+        rows = self.kept_rows()
+        results = {}
+        for column, label in enumerate(self.labels + ("total",)):
+            values = sorted(row[column] for row in rows)
+            results[label] = {
+                "mean_ms": sum(values) / len(values) / 1e6 if values else 0.0,
+                "p99_ms": percentile(values, 0.99) / 1e6 if values else 0.0,
+            }
+        return results
+
+    def toggle_overlay(self):
+        """show or hide the overlay. Showing it turns profiling on, hiding it
+        turns it back off unless it was on before"""
+        self.overlay = not self.overlay
+        if not self.overlay:
+            self.enabled = self.was_enabled
+        else:
+            self.was_enabled = self.enabled
+            if not self.enabled:
+                # the current frame starts now, not when profiling was last on
+                self.enabled = True
+                self.frame_start = perf_counter_ns()
+                for i in range(self.row, self.row + self.columns):
+                    self.times[i] = 0
+        self.overlay_surface = None
+
+    def render_overlay(self):
+        """render the text of the overlay from the current stats"""
+        if self.font is None:
+            self.font = pygame.font.Font(None, OVERLAY_FONT_SIZE)
+        lines = [
+            f"{label:<12} avg {stat['mean_ms']:6.2f} ms  p99 {stat['p99_ms']:6.2f} ms"
+            for label, stat in self.stats().items()
+        ]
+        rendered = [self.font.render(line, True, OVERLAY_COLOR) for line in lines]
+        width = max(text.get_width() for text in rendered) + 8
+        height = sum(text.get_height() for text in rendered) + 8
+        surface = pygame.Surface((width, height), pygame.SRCALPHA)
+        surface.fill(OVERLAY_BACKGROUND)
+        y = 4
+        for text in rendered:
+            surface.blit(text, (4, y))
+            y += text.get_height()
+        self.overlay_surface = surface
+
+    def draw_overlay(self, screen, position=(0, 0)):
+        """draw the overlay onto screen if it is shown and return the rect it
+        covers, or None"""
+        if not self.overlay:
+            return None
+        if self.overlay_surface is None:
+            self.render_overlay()
+        return screen.blit(self.overlay_surface, position)
+
+    def export(self, path: str):
+        """write the kept frames in ms to path, as JSON if it ends in .json
+        and as CSV otherwise"""
+        rows = self.kept_rows()
+        first = self.frame - len(rows)
+        columns = self.labels + ("total",)
+        path = Path(path)
+        if path.suffix == ".json":
+            data = {
+                "sections": list(columns),
+                "summary": self.stats(),
+                "frames": [
+                    {"frame": first + i, **{label: value / 1e6 for label, value in zip(columns, row)}}
+                    for i, row in enumerate(rows)
+                ],
+            }
+            path.write_text(json.dumps(data))
+            return
+        with open(path, "w") as file:
+            file.write(",".join(("frame",) + tuple(f"{label}_ms" for label in columns)) + "\n")
+            for i, row in enumerate(rows):
+                file.write(",".join([str(first + i)] + [f"{value / 1e6:.4f}" for value in row]) + "\n")
@@ -1,7 +1,23 @@
+import argparse
+import os
+import sys
 import pygame
 import random
 import snake_ui
-from typing import Tuple
+from collections import deque
+from typing import Optional, Tuple
+
+# frame_profiler.py is shared by all the games
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "shared"))
+
+from frame_profiler import FrameProfiler
+
+# sections of a frame timed by the profiler, F3 shows them
+PROFILED_SECTIONS = ("wait", "input", "logic", "draw", "flip")
+# where the score is drawn and with what
+SCORE_POSITION = (10, 10)
+SCORE_COLOR = (255, 255, 255)
+SCORE_FONT = ('arial.ttf', 46)
 
 
 class Fruit:
@@ -14,10 +30,56 @@ class Fruit:
         self.color = color
 
 
+class FreeCells:
+    """The cells of the grid the snake isn't on.
+
+    The cells are kept in a list, with the index of every cell in a dict, so
+    adding a cell, removing one and picking one at random all take the same
+    time however full the grid is.
+    """
+    __slots__ = 'cells', 'index'
+
+    def __init__(self, grid_size: Tuple[int, int]) -> None:
+        """Init with every cell of the grid free."""
+        self.cells = [(x, y) for x in range(grid_size[0]) for y in range(grid_size[1])]
+        self.index = {cell: i for i, cell in enumerate(self.cells)}
+
+    def __len__(self) -> int:
+        return len(self.cells)
+
+    def add(self, cell: Tuple[int, int]) -> None:
+        """Set cell free."""
+        if cell not in self.index:
+            self.index[cell] = len(self.cells)
+            self.cells.append(cell)
+
+    def discard(self, cell: Tuple[int, int]) -> None:
+        """Set cell taken, if it is a free cell of the grid."""
+        i = self.index.pop(cell, None)
+        if i is None:
+            return
+        # the last cell takes the place of the removed one
+        last = self.cells.pop()
+        if i < len(self.cells):
+            self.cells[i] = last
+            self.index[last] = i
+
+    def choice(self) -> Optional[Tuple[int, int]]:
+        """Return a random free cell, or None when the grid is full."""
+        if not self.cells:
+            return None
+        return self.cells[random.randrange(len(self.cells))]
+
+
 class Snake:
     def __init__(self, pos, direction, start_length=3, color=(255, 255, 255)):
         self.pos = pos
-        self.parts = [pos]
+        # head first, moving only adds a head and drops the tail
+        self.parts = deque([pos])
+        # the cells of parts, to tell in one lookup whether a cell is on the snake
+        self.occupied = {pos}
+        # whether the head ran into the body on the last update
+        self.collided = False
 
         # how many bodyparts it can grow
         # usually only 0 or 1
@@ -26,33 +88,127 @@ class Snake:
         self.direction = direction
 
     def update_snake(self):
-        tail = self.parts[-1]
-
-        # Updating the bodyparts
-        partcopy = self.parts.copy()
-        for part in range(len(partcopy) - 1):
-            self.parts[part + 1] = partcopy[part]
+        """Move the head one cell in direction. The tail stays where it was
+        while the snake is growing. Return the cell the tail left, or None."""
+        head_pos = self.parts[0]
+        head_pos = (head_pos[0] + self.direction[0], head_pos[1] + self.direction[1])
 
         # Growing a new bodypart
         if self.grow_count > 0:
-            self.parts.append(tail)
             self.grow_count -= 1
+            tail = None
+        else:
+            tail = self.parts.pop()
+            self.occupied.discard(tail)
 
-        head_pos = self.parts[0]
-        head_pos = (head_pos[0] + self.direction[0], head_pos[1] + self.direction[1])
-        self.parts[0] = head_pos
+        self.collided = head_pos in self.occupied
+        self.parts.appendleft(head_pos)
+        self.occupied.add(head_pos)
+        return tail
 
     def grow_snake(self):
         self.grow_count += 1
 
 
+class Renderer:
+    """Draws only the cells of the game that changed.
+
+    A tick only moves the head and the tail of the snake and sometimes the
+    fruit, so only those cells are drawn again and only their rects are
+    passed to pygame.display.update, however long the snake is or however
+    big the grid is. The score and anything else drawn over the cells is
+    kept right with redraw. After reset the next frame redraws everything.
+    """
+    __slots__ = 'game', 'background_color', 'changed', 'score', 'score_rect', 'full'
+
+    def __init__(self, game, background_color=(0, 0, 0)) -> None:
+        """Init a renderer of game that redraws everything on the first frame."""
+        self.game = game
+        self.background_color = background_color
+        # cells that look different since the last frame
+        self.changed = set()
+        # the score last drawn and the rect it was drawn over
+        self.score = None
+        self.score_rect = pygame.Rect(SCORE_POSITION, (0, 0))
+        self.full = True
+
+    def reset(self) -> None:
+        """Redraw the whole screen next frame, for when it was lost or resized."""
+        self.full = True
+
+    def cell_changed(self, cell: Tuple[int, int]) -> None:
+        """Draw cell again next frame."""
+        self.changed.add(cell)
+
+    def cell_rect(self, cell: Tuple[int, int]) -> pygame.Rect:
+        """Return the screen rect of a cell."""
+        size = self.game.square_size
+        return pygame.Rect(cell[0] * size, cell[1] * size, size, size)
+
+    def draw_cell(self, cell: Tuple[int, int]) -> pygame.Rect:
+        """Draw a cell as whatever is on it and return its rect."""
+        game = self.game
+        if cell in game.snake.occupied:
+            color = game.snake.color
+        elif cell == game.fruit.position:
+            color = game.fruit.color
+        else:
+            color = self.background_color
+        return pygame.draw.rect(game.screen, color, self.cell_rect(cell))
+
+    def draw_score(self) -> pygame.Rect:
+        """Draw the score and return the rect it was drawn over."""
+        self.score = f'{len(self.game.snake.parts)}'
+        self.score_rect = snake_ui.draw_text(self.score, self.game.screen, SCORE_COLOR, SCORE_POSITION, *SCORE_FONT)
+        return self.score_rect
+
+    def redraw(self, screen_rect: pygame.Rect) -> pygame.Rect:
+        """Draw the cells and the score inside a rect of the screen again, to
+        clear something drawn over them. Return the rect."""
+        game = self.game
+        screen_rect = screen_rect.clip(game.screen.get_rect())
+        game.screen.fill(self.background_color, screen_rect)
+        size = game.square_size
+        for x in range(screen_rect.left // size, -(-screen_rect.right // size)):
+            for y in range(screen_rect.top // size, -(-screen_rect.bottom // size)):
+                rect = self.draw_cell((x, y))
+                # the cell can stick out of screen_rect
+                screen_rect.union_ip(rect)
+        if screen_rect.colliderect(self.score_rect):
+            screen_rect.union_ip(self.draw_score())
+        return screen_rect
+
+    def draw(self):
+        """Draw what changed and return the rects drawn over, or None when the
+        whole screen was drawn."""
+        game = self.game
+        if self.full:
+            self.full = False
+            self.changed.clear()
+            game.screen.fill(self.background_color)
+            for part in game.snake.parts:
+                self.draw_cell(part)
+            if game.fruit.position is not None:
+                self.draw_cell(game.fruit.position)
+            self.draw_score()
+            return None
+        updates = [self.draw_cell(cell) for cell in self.changed]
+        self.changed.clear()
+        score_changed = self.score != f'{len(game.snake.parts)}'
+        if score_changed or self.score_rect.collidelist(updates) != -1:
+            # clears the old score along with the cells under it and draws the new one
+            updates.append(self.redraw(self.score_rect))
+        return updates
+
+
 class Game:
     def __init__(
             self,
             grid_size=(32, 32),
             square_size=16,
             speed=20,
-            background_color=(0, 0, 0)
+            background_color=(0, 0, 0),
+            profile_path=None
     ):
         pygame.init()
         pygame.display.set_caption("Snake")
@@ -65,25 +221,42 @@ class Game:
         self.screen.fill(background_color)
         self.fps = pygame.time.Clock()
         self.snake = Snake((16, 16), (1, 0))
+        # cells fruit can be placed on
+        self.free_cells = FreeCells(grid_size)
+        self.free_cells.discard(self.snake.pos)
         self.fruit = Fruit(position=self.generate_random_coords())
+        self.renderer = Renderer(self, background_color)
+        # with profile_path every frame is timed and written there on exit
+        self.profiler = FrameProfiler(PROFILED_SECTIONS, export_path=profile_path)
+        # screen rect the profiler overlay was last drawn over
+        self.overlay_rect = None
 
-    def generate_random_coords(self) -> Tuple[int, int]:
-        """Generate random x and y coordinates within the grid constraints and return the coordinates as a tuple."""
-        x_coord = random.randint(0, self.grid_size[0] - 1)
-        y_coord = random.randint(0, self.grid_size[1] - 1)
-        return (x_coord, y_coord)
+    def generate_random_coords(self) -> Optional[Tuple[int, int]]:
+        """Return the coordinates of a random cell the snake isn't on as a tuple,
+        or None when the snake fills the grid."""
+        return self.free_cells.choice()
 
     def run(self):
+        profiler = self.profiler
         while True:
-            self.fps.tick(self.speed)
-            self.get_input()
-            self.update_game()
+            with profiler.section("wait"):
+                self.fps.tick(self.speed)
+            with profiler.section("input"):
+                self.get_input()
+            with profiler.section("logic"):
+                self.update_game()
             self.draw_game()
+            profiler.end_frame()
 
     def get_input(self):
         newdir = self.snake.direction
         for event in pygame.event.get():
+            if event.type in (pygame.VIDEOEXPOSE, pygame.VIDEORESIZE):
+                # what was on the screen is gone
+                self.renderer.reset()
             if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_F3:
+                    self.profiler.toggle_overlay()
                 if event.key == pygame.K_UP:
                     newdir = (0, -1)
                 if event.key == pygame.K_DOWN:
@@ -102,9 +275,14 @@ class Game:
 
     # Updates the position of the snake, and checks other things
     def update_game(self):
-        self.snake.update_snake()
+        tail = self.snake.update_snake()
+        if tail is not None:
+            self.free_cells.add(tail)
+            self.renderer.cell_changed(tail)
+        self.free_cells.discard(self.snake.parts[0])
+        self.renderer.cell_changed(self.snake.parts[0])
         # If the snake has collided with itself
-        if self.snake.parts[0] in self.snake.parts[1:]:
+        if self.snake.collided:
             quit()
         # If the snake has collided with the wall
         if not 0 <= self.snake.parts[0][0] < self.grid_size[0] or not 0 <= self.snake.parts[0][1] < self.grid_size[1]:
@@ -112,18 +290,34 @@ class Game:
         # If the snake has collided with a fruit, spawn a new one and grow the snake
         if self.snake.parts[0] == self.fruit.position:
             self.fruit.position = self.generate_random_coords()
+            if self.fruit.position is not None:
+                self.renderer.cell_changed(self.fruit.position)
             self.snake.grow_snake()
 
     def draw_game(self):
-        self.screen.fill((0, 0, 0))
-        # draw score
-        for part in self.snake.parts:
-            pygame.draw.rect(self.screen, self.snake.color, pygame.Rect(part[0] * 16, part[1] * 16, 16, 16))
-        pygame.draw.rect(self.screen, self.fruit.color, pygame.Rect(self.fruit.position[0] * 16, self.fruit.position[1] * 16, 16, 16))
-        snake_ui.draw_text(f'{len(self.snake.parts)}', self.screen, (255,255,255), (10,10), 'arial.ttf', 46)
-        pygame.display.flip()
+        with self.profiler.section("draw"):
+            updates = self.renderer.draw()
+            if self.overlay_rect is not None:
+                # draw the cells under the last overlay again
+                if updates is not None:
+                    updates.append(self.renderer.redraw(self.overlay_rect))
+                self.overlay_rect = None
+            # below the score
+            self.overlay_rect = self.profiler.draw_overlay(self.screen, (0, 50))
+            if updates is not None and self.overlay_rect is not None:
+                updates.append(self.overlay_rect)
+        with self.profiler.section("flip"):
+            if updates is None:
+                pygame.display.flip()
+            else:
+                pygame.display.update(updates)
 
 
 if __name__ == "__main__":
-    game = Game()
+    parser = argparse.ArgumentParser(description="Snake")
+    parser.add_argument(
+        "--profile", metavar="PATH", help="time every frame and write the last frames to PATH (.csv or .json) on exit"
+    )
+    args = parser.parse_args()
+    game = Game(profile_path=args.profile)
     game.run()
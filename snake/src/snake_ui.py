@@ -1,7 +1,40 @@
+from collections import OrderedDict
+
 import pygame as pg
 
 pg.font.init()
 
+# rendered texts kept by render_text before the least recently used is dropped
+MAX_TEXTS = 64
+
+# font of every (name, size), SysFont searches the system fonts every time it is called
+fonts = {}
+# rendered surface of every (content, color, font name, font size), least recently used first
+texts = OrderedDict()
+
+
+def get_font(font_name: str, font_size: int) -> pg.font.Font:
+    """Return the system font with the given name and size, only looked up the first time."""
+    key = (font_name, font_size)
+    font = fonts.get(key)
+    if font is None:
+        font = fonts[key] = pg.font.SysFont(font_name, font_size)
+    return font
+
+
+def render_text(content: str, color: tuple[int, int, int], font_name: str, font_size: int) -> pg.Surface:
+    """Return content rendered with a font, only rendered again once it was
+    dropped from the MAX_TEXTS most recently used texts."""
+    key = (content, tuple(color), font_name, font_size)
+    text = texts.get(key)
+    if text is not None:
+        texts.move_to_end(key)
+        return text
+    text = texts[key] = get_font(font_name, font_size).render(content, True, color)
+    if len(texts) > MAX_TEXTS:
+        texts.popitem(last=False)
+    return text
+
 
 def draw_text(
     content: str,
@@ -11,6 +44,5 @@ def draw_text(
     font_name: str,
     font_size: int
 ):
-    font = pg.font.SysFont(font_name, font_size)
-    score_text = font.render(content, True, color)
-    screen.blit(score_text, position)
+    """Draw content at position, see render_text. Returns the rect drawn over."""
+    return screen.blit(render_text(content, color, font_name, font_size), position)